@@ -1,61 +1,272 @@
 from flask import Flask, render_template, request, jsonify, Response, send_file
 from PIL import Image
 from io import BytesIO
-import base64
+import json
+import struct
 import threading
 import time
 import os
 import platform
 
 # Required libraries
-import torch
-import torchvision.transforms as T
-from torchvision.models import resnet50, ResNet50_Weights
-import numpy as np
-import requests
-from functools import lru_cache
-import hashlib
-import cv2  # optional
 import mss  # required for capture
+from capture_backend import FrameStore, FramePacer, TileDiffer, SharedFrameRing, make_grabber
+from capture_manager import CaptureManager
+import stream_codec
+import snapshot
+import metrics
+
+# torch, torchvision and the inference modules load on the first inference-related call,
+# so the streaming routes (and the health check on /) answer before they are imported
+
+# EmbeddingPool starts its workers with spawn, which re-imports this script as __mp_main__ in
+# each of them. Everything at module level must stay import-only (no threads, grabs or model
+# loads); the few startup messages below are skipped there
+IS_POOL_WORKER = __name__ == '__mp_main__'
 
 app = Flask(__name__, template_folder='templates')
 
-# GPU setup
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-print(f"Using device: {device}")
+# GPU setup (lazy)
+_device = None
+def get_device():
+    global _device
+    if _device is None:
+        import torch
+        _device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        print(f"Using device: {_device}")
+    return _device
 
 # Model lazy loading (keep your original - placeholder)
 _model = None
 _model_loaded = False
+_model_lock = threading.Lock()
 def get_model():
     global _model, _model_loaded
-    if not _model_loaded:
-        print("Loading ResNet50...")
-        _model = resnet50(weights=ResNet50_Weights.IMAGENET1K_V2)
-        _model = torch.nn.Sequential(*list(_model.children())[:-1])
-        _model = _model.to(device)
-        _model.eval()
-        if device.type == 'cuda':
-            torch.backends.cudnn.benchmark = True
-        _model_loaded = True
+    with _model_lock:
+        if not _model_loaded:
+            import torch
+            import backbone
+            device = get_device()
+            # MODEL_MODE picks an optional CPU inference mode (see backbone.py); default is plain fp32
+            print(f"Loading ResNet50 ({backbone.MODEL_MODE})...")
+            _model = backbone.load_backbone(backbone.MODEL_MODE, device)
+            if device.type == 'cuda':
+                torch.backends.cudnn.benchmark = True
+            _model_loaded = True
     return _model
 
-preprocess = T.Compose([
-    T.Resize((224, 224)),
-    T.ToTensor(),
-    T.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-])
+_preprocess = None
+def get_preprocess():
+    global _preprocess
+    if _preprocess is None:
+        import torchvision.transforms as T
+        _preprocess = T.Compose([
+            T.Resize((224, 224)),
+            T.ToTensor(),
+            T.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+        ])
+    return _preprocess
+
+def __getattr__(name):
+    # `from app import device, preprocess` keeps working, it just triggers the lazy import
+    if name == 'device':
+        return get_device()
+    if name == 'preprocess':
+        return get_preprocess()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Set once the process can serve inference; /ready reports it, along with a failed warm-up
+model_ready = threading.Event()
+model_error = None
+
+def warm_up_model():
+    # Load the model (from the local model store, see backbone.py) and run one dummy batch
+    # so the first real inference doesn't pay for it
+    global model_error
+    start = time.time()
+    try:
+        import torch
+        model = get_model()
+        with torch.inference_mode():
+            model(torch.zeros(8, 3, 224, 224, device=get_device()))
+    except Exception as e:
+        model_error = f"{type(e).__name__}: {e}"
+        print(f"[ERROR] Model warm-up failed: {e}")
+        return
+    model_ready.set()
+    print(f"[INFO] Model warm-up done in {time.time() - start:.2f}s")
+
+def start_model_warmup():
+    # Optional (MODEL_WARMUP=1); called from the serving process, after any fork
+    if os.environ.get('MODEL_WARMUP') == '1':
+        threading.Thread(target=warm_up_model, daemon=True).start()
+    else:
+        model_ready.set()  # the model loads on first use instead
 
 # ... PASTE ALL YOUR OTHER FUNCTIONS HERE (satellite tiles, embeddings, etc.) ...
 
+# Satellite tiles: in-memory LRU in front of the on-disk store shared by all workers (tile_cache.py)
+_tile_cache = None
+_tile_cache_lock = threading.Lock()
+def get_tile_cache():
+    global _tile_cache
+    with _tile_cache_lock:
+        if _tile_cache is None:
+            import tile_cache
+            # Without TILE_URL only tiles already on disk can be served
+            if tile_cache.TILE_URL:
+                import tile_fetcher
+                fetch = tile_fetcher.TileFetcher()
+            else:
+                fetch = tile_cache.http_fetch
+            _tile_cache = tile_cache.TileCache(fetch=fetch)
+    return _tile_cache
+
+def download_satellite_tile_cached(lat, lon, zoom=18):
+    import tile_cache
+    x, y = tile_cache.latlon_to_tile(lat, lon, zoom)
+    return get_tile_cache().get_image(zoom, x, y)
+
+# Embeddings by tile content hash, augmentation and model version (embedding_cache.py)
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+def get_embedding_cache():
+    global _embedding_cache
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            import embedding_cache
+            _embedding_cache = embedding_cache.EmbeddingCache()
+    return _embedding_cache
+
+# EMBEDDING_WORKERS=N embeds tiles on N persistent worker processes (embedding_pool.py), CPU only
+_embedding_pool = None
+_embedding_pool_lock = threading.Lock()  # held while the workers load the model; tile lookups don't wait on it
+def get_embedding_pool():
+    global _embedding_pool
+    with _embedding_pool_lock:
+        if _embedding_pool is None and int(os.environ.get('EMBEDDING_WORKERS', 0)) > 0 and get_device().type == 'cpu':
+            import embedding_pool
+            _embedding_pool = embedding_pool.EmbeddingPool()
+    return _embedding_pool
+
+def get_model_version():
+    import backbone
+    return backbone.model_version(backbone.MODEL_MODE, get_device())
+
+def embed_tiles(tiles, prefetch_neighbours=True, augmentation="none"):
+    # (tiles that downloaded, their embeddings[N, 2048]); tiles come through the tile cache,
+    # embeddings from the embedding cache or get_model()
+    import embedding_cache
+    import tile_cache
+    import tile_fetcher
+    import tile_index
+    cache = get_tile_cache()
+    found = cache.get_many(tiles)
+    if prefetch_neighbours:
+        # The next search is usually next door; fetch the surrounding ring while this one embeds
+        cache.prefetch(tile_fetcher.neighbour_ring(tiles))
+    tiles = [t for t in tiles if t in found]
+    version = get_model_version()
+    keys = [embedding_cache.cache_key(found[t], augmentation, version) for t in tiles]
+
+    def compute(indices):
+        images = [tile_cache.tile_image(found[tiles[i]]) for i in indices]
+        pool = get_embedding_pool()
+        with metrics.inference_seconds.labels("tiles").time():
+            if pool:
+                return pool.embed(images)
+            return tile_index.embed_images(get_model(), images, get_device())
+    return tiles, get_embedding_cache().get_or_compute(keys, compute)
+
+# Tile embeddings are computed once per region and searched as one matrix (tile_index.py)
+def build_tile_index(lat, lon, grid=5, zoom=18, path=None):
+    import backbone
+    import tile_index
+    tiles, embeddings = embed_tiles(tile_index.region_tiles(lat, lon, grid, zoom))
+    index = tile_index.EmbeddingIndex.build(embeddings, tiles, model=backbone.MODEL_MODE)
+    if path:
+        index.save(path)
+    return index
+
+def match_tiles(query_img, index, k=5):
+    # [(cosine, (z, x, y)), ...] best first
+    import tile_index
+    embedding = tile_index.embed_images(get_model(), [query_img], get_device())[0]
+    scores, coords = index.search(embedding, k)
+    return [(float(s), tuple(int(v) for v in c)) for s, c in zip(scores, coords)]
+
+def localize_hierarchical(query_img, lat, lon, radius_m, zoom=18, beam=4, k=5):
+    # Coarse-to-fine alternative to the N x N grid at one zoom (hierarchical_search.py)
+    import hierarchical_search
+    import tile_index
+    query = tile_index.embed_images(get_model(), [query_img], get_device())[0]
+    # Each level's children lie inside the previous level's tiles, so a neighbour ring would be wasted
+    return hierarchical_search.hierarchical_search(
+        query, lat, lon, radius_m, lambda tiles: embed_tiles(tiles, prefetch_neighbours=False),
+        target_zoom=zoom, beam=beam, k=k)
+
 # ================== DESKTOP STREAMING GLOBALS ==================
 
 desktop_stream_active = False
 desktop_stream_thread = None
-desktop_stream_lock = threading.Lock()
-desktop_last_frame = None
-desktop_stats = {"fps": 0, "frames": 0}
+desktop_frames = FrameStore()  # latest raw frames; PIL images are built lazily
+desktop_encoder_lock = threading.Lock()
+desktop_video_encoder = None  # H.264 encoder, started by the first /video_stream_h264 viewer
+desktop_video_settings = {"bitrate": stream_codec.DEFAULT_BITRATE, "keyint": stream_codec.DEFAULT_KEYINT}
+desktop_stats = {"fps": 0, "frames": 0, "target_fps": 30.0, "jitter_ms": 0.0, "frames_dropped": 0}
+desktop_stats_lock = threading.Lock()  # writers update desktop_stats as a whole, readers copy it under the lock
 desktop_region = None
+desktop_capture_source = None  # grabber source of the running capture ("mss", "synthetic:moving", ...)
+desktop_capture_rect = None  # (x, y, w, h) in desktop coordinates of the main capture's frames
+
+class FrameBus:
+    """Holds the latest encoded frame; the capture thread publishes, viewers wait on the sequence number."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._data = None
+
+    def publish(self, data):
+        start = time.perf_counter()
+        with self._cond:
+            metrics.lock_wait_seconds.observe(time.perf_counter() - start)
+            self._seq += 1
+            self._data = data
+            self._cond.notify_all()
+
+    def latest(self):
+        with self._cond:
+            return self._seq, self._data
+
+    def wait_for(self, last_seq, timeout=1.0):
+        # Returns (seq, data); seq == last_seq means nothing new arrived before the timeout
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq != last_seq, timeout=timeout)
+            return self._seq, self._data
+
+desktop_frame_bus = FrameBus()  # full JPEG per changed frame (/video_stream)
+desktop_tile_bus = FrameBus()   # (frame_seq, base_seq, size, full_jpeg, tile_message) per changed frame (/tile_stream)
+desktop_raw_bus = FrameBus()    # raw Frame per changed frame, for the per-viewer stream variants
+desktop_embedding_bus = FrameBus()  # (frame_seqs, embeddings, batch_ms) from the inference stage
+desktop_inference = None  # InferenceStage when the capture was started with embed=true
+
+def encode_jpeg(img, quality=80):
+    start = time.perf_counter()
+    buf = BytesIO()
+    img.save(buf, format="JPEG", quality=quality, optimize=True)
+    metrics.encode_seconds.observe(time.perf_counter() - start)
+    return buf.getvalue()
+
+def pack_tile_message(seq, size, tiles):
+    # 4-byte header length, JSON header listing [x, y, w, h, nbytes] per tile, then the JPEG bytes back to back
+    header = json.dumps({
+        "seq": seq,
+        "width": size[0],
+        "height": size[1],
+        "tiles": [[x, y, w, h, len(data)] for x, y, w, h, data in tiles],
+    }).encode()
+    return struct.pack(">I", len(header)) + header + b''.join(t[4] for t in tiles)
 
 # Detect headless
 IS_HEADLESS = (
@@ -64,118 +275,583 @@ IS_HEADLESS = (
     platform.system() == 'Linux' and not os.getenv('XDG_SESSION_TYPE')
 )
 
-print(f"[INFO] Running in {'HEADLESS' if IS_HEADLESS else 'GUI'} mode")
+if not IS_POOL_WORKER:
+    print(f"[INFO] Running in {'HEADLESS' if IS_HEADLESS else 'GUI'} mode")
+
+# mss, synthetic[:moving|static|noise], or auto (mss if a display opens, else a synthetic pattern).
+# Synthetic frames are never picked unless asked for; /get_stats and X-Capture-Source report them
+CAPTURE_SOURCE = os.environ.get('CAPTURE_SOURCE', 'mss')
+if IS_HEADLESS and CAPTURE_SOURCE == 'mss' and not IS_POOL_WORKER:
+    print("[INFO] No display detected; grabs fail until one is available (CAPTURE_SOURCE=synthetic streams a test pattern)")
+
+def new_grabber():
+    return make_grabber(CAPTURE_SOURCE)
+
+def grab_desktop(region=None):
+    # One-off raw grab (e.g. /get_screenshot); the capture thread keeps its own grabber
+    if not mss:
+        print("[ERROR] Screenshot capture failed: mss library not installed")
+        return None
+    with new_grabber() as grabber:
+        return grabber.grab(region)
 
 def capture_desktop_screenshot(region=None):
-    try:
-        if not mss:
-            raise RuntimeError("mss library not installed")
-
-        with mss.mss() as sct:
-            print(f"[DEBUG] Available monitors: {sct.monitors}")  # Log for debugging
-            
-            # Use monitor 0 (virtual/full desktop) on headless - safer than monitor[1]
-            monitor = sct.monitors[0] if len(sct.monitors) > 0 else None
-            if not monitor:
-                raise RuntimeError("No monitors detected by mss")
-
-            if region:
-                x, y, w, h = region
-                mon = {"top": y, "left": x, "width": w, "height": h}
-            else:
-                mon = monitor
-            
-            print(f"[DEBUG] Capturing monitor: {mon}")
-            screenshot = sct.grab(mon)
-            img = Image.frombytes("RGB", screenshot.size, screenshot.rgb)
-            return img
-    except Exception as e:
-        print(f"[ERROR] Screenshot capture failed: {type(e).__name__}: {e}")
+    screenshot = grab_desktop(region)
+    if screenshot is None:
+        return None
+    return Image.frombytes("RGB", screenshot.size, screenshot.bgra, "raw", "BGRX")
+
+def render_desktop_snapshot(args, if_none_match=None):
+    # (status, body, headers) for /get_screenshot, or None if the grab failed;
+    # raises ValueError for bad ?format=/&level=. Shared by the Flask and ASGI routes
+    fmt, level = snapshot.parse_options(args)
+    frame = desktop_frames.latest() if desktop_stream_active and desktop_region is None else None
+    if frame is not None:
+        # A full-desktop capture is running: serve its newest frame instead of grabbing again.
+        # Copied first, the ring slot can be reused while this encodes
+        status, body, headers = snapshot.render(frame.bgra.tobytes(), frame.size, fmt, level, if_none_match)
+        headers['X-Frame-Source'] = 'live'
+        headers['X-Capture-Source'] = desktop_capture_source or CAPTURE_SOURCE
+        return status, body, headers
+    screenshot = grab_desktop()
+    if screenshot is None:
         return None
+    status, body, headers = snapshot.render(screenshot.bgra, screenshot.size, fmt, level, if_none_match)
+    headers['X-Frame-Source'] = 'grab'
+    headers['X-Capture-Source'] = getattr(screenshot, 'source', 'mss')
+    return status, body, headers
 
 @app.route('/get_screenshot')
 def get_screenshot():
-    img = capture_desktop_screenshot()
-    if img:
-        buf = BytesIO()
-        img.save(buf, format="PNG", optimize=True, quality=75)
-        b64 = base64.b64encode(buf.getvalue()).decode('ascii')
-        return jsonify({'b64': b64})
-    return jsonify({'error': 'Failed to capture screenshot - check server logs'})
-
-def start_desktop_capture(data):
-    global desktop_stream_active, desktop_stream_thread, desktop_region
+    # Binary image: ?format=jpeg|webp|png&level=; size in X-Image-Width/Height, 304 when If-None-Match is current
+    try:
+        result = render_desktop_snapshot(request.args, request.headers.get('If-None-Match'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if result is None:
+        return jsonify({'error': 'Failed to capture screenshot - check server logs'}), 500
+    status, body, headers = result
+    return Response(body, status=status, headers=headers)
+
+class CaptureSession:
+    """State for one capture run; step() grabs, stores, encodes and publishes a single frame."""
+
+    def __init__(self, fps):
+        self.grabber = new_grabber()
+        # SHARED_CAPTURE=1 copies changed frames to shared memory for screenshot_tool.py to serve
+        # snapshots from; off by default, as the copy costs ~2 ms per 1080p frame with no reader
+        self.shared = SharedFrameRing(source=self.grabber.source) if os.environ.get('SHARED_CAPTURE', '0') == '1' else None
+        self.pacer = FramePacer(fps)
+        self.differ = TileDiffer()
+        self.base_seq = 0
+        self.frame_count = 0
+        self.start_time = time.monotonic()
+
+    def step(self):
+        # Returns the full-frame JPEG when the frame changed, otherwise None
+        global desktop_video_encoder, desktop_capture_rect
+        start = time.perf_counter()
+        screenshot = self.grabber.grab(desktop_region)
+        if not screenshot:
+            return None
+        grabbed = time.perf_counter()
+        metrics.grab_seconds.observe(grabbed - start)
+        monitor = self.grabber.monitor_for(desktop_region)
+        desktop_capture_rect = (monitor["left"], monitor["top"], monitor["width"], monitor["height"])
+        frame = desktop_frames.write(screenshot)
+        convert = time.perf_counter() - grabbed
+        encoder = desktop_video_encoder
+        if encoder:
+            if encoder.size == frame.size:
+                encoder.write(frame)  # every frame, the codec handles static content itself
+            else:
+                # Display layout changed under a full-screen capture; viewers reconnect
+                desktop_video_encoder = None
+                encoder.close()
+        full_jpeg = None
+        rects = self.differ.diff(frame)
+        if rects:  # static screen: nothing to encode or send
+            # Encode once here; every viewer shares these bytes
+            start = time.perf_counter()
+            img = frame.to_image()
+            convert += time.perf_counter() - start
+            full_jpeg = encode_jpeg(img)
+            tiles = [
+                (x, y, w, h, full_jpeg if (w, h) == frame.size else encode_jpeg(img.crop((x, y, x + w, y + h))))
+                for x, y, w, h in rects
+            ]
+            desktop_frame_bus.publish(full_jpeg)
+            desktop_raw_bus.publish(frame)
+            if self.shared:
+                self.shared.publish(frame, (monitor["left"], monitor["top"]), self.grabber.monitors[1])
+            if desktop_inference:
+                desktop_inference.submit(frame.seq, frame)
+            desktop_tile_bus.publish((frame.seq, self.base_seq, frame.size, full_jpeg, pack_tile_message(frame.seq, frame.size, tiles)))
+            self.base_seq = frame.seq
+            metrics.frames_changed_total.inc()
+        elif self.shared:
+            self.shared.touch()  # same pixels as the published frame; keep it fresh for readers
+        metrics.convert_seconds.observe(convert)
+        metrics.frames_total.inc()
+        self.frame_count += 1
+        now = time.monotonic()
+        if now - self.start_time >= 1.0:
+            # One clock read closes this window and opens the next, and the stats change in one
+            # locked update, so /get_stats never sees a new fps next to an old frame count
+            pacing = self.pacer.stats()
+            fps = self.frame_count / (now - self.start_time)
+            with desktop_stats_lock:
+                desktop_stats.update(fps=fps, frames=desktop_stats["frames"] + self.frame_count,
+                                     jitter_ms=pacing["jitter_ms"], frames_dropped=pacing["frames_dropped"])
+            metrics.capture_fps.set(fps)
+            metrics.frames_dropped.set(pacing["frames_dropped"])
+            self.start_time = now
+            self.frame_count = 0
+        return full_jpeg
+
+    def close(self):
+        self.grabber.close()
+        if self.shared:
+            self.shared.close()
+
+def capture_loop(session):
+    try:
+        while desktop_stream_active:
+            session.pacer.wait()  # sleeps until the next frame deadline, skips deadlines it has missed
+            session.step()
+    finally:
+        session.close()
+
+def start_desktop_capture(data, launcher=None):
+    # launcher(session) runs the capture loop elsewhere (asgi_app.py); default is a daemon thread.
+    # Raises ValueError for invalid options, which the routes answer with 400
+    global desktop_stream_active, desktop_stream_thread, desktop_region, desktop_inference, desktop_capture_source
     
+    if data.get('session'):
+        return start_named_capture(data)
     if desktop_stream_active:
-        return {"status": "⚠️ Already capturing"}
+        return {"status": "⚠️ Already capturing (pass a session name to capture another region)"}
     
-    x = int(data.get('x', 0))
-    y = int(data.get('y', 0))
-    w = int(data.get('w', 1920))
-    h = int(data.get('h', 1080))
+    try:
+        x, y, w, h = (int(data.get(k, d)) for k, d in (('x', 0), ('y', 0), ('w', 1920), ('h', 1080)))
+        fps = float(data.get('fps', 30))
+    except (TypeError, ValueError):
+        raise ValueError("Region and FPS must be numbers") from None
     
     if w < 64 or h < 64:
-        return {"status": "❌ Region too small"}
+        raise ValueError("Region too small")
+    if not 1 <= fps <= 120:
+        raise ValueError("FPS must be between 1 and 120")
+    bitrate = stream_codec.parse_bitrate(data.get('bitrate', stream_codec.DEFAULT_BITRATE))
+    keyint = stream_codec.parse_keyint(data.get('keyint', stream_codec.DEFAULT_KEYINT))
     
     desktop_region = (x, y, w, h) if (x > 0 or y > 0 or w < 1920 or h < 1080) else None
     desktop_stream_active = True
     
-    def capture_loop():
-        global desktop_last_frame, desktop_stats
-        start_time = time.time()
-        frame_count = 0
-        while desktop_stream_active:
-            img = capture_desktop_screenshot(desktop_region)
-            if img:
-                with desktop_stream_lock:
-                    desktop_last_frame = img.copy()
-                frame_count += 1
-                if time.time() - start_time >= 1.0:
-                    desktop_stats["fps"] = frame_count / (time.time() - start_time)
-                    desktop_stats["frames"] += frame_count
-                    start_time = time.time()
-                    frame_count = 0
-            time.sleep(0.033)  # ~30 fps
+    with desktop_stats_lock:
+        desktop_stats.update(target_fps=fps, frames_dropped=0, jitter_ms=0.0)
+    desktop_video_settings.update(bitrate=bitrate, keyint=keyint)
     
-    desktop_stream_thread = threading.Thread(target=capture_loop, daemon=True)
-    desktop_stream_thread.start()
+    try:
+        # Embed changed frames with ResNet50 in the background (opt-in, it costs CPU)
+        if data.get('embed', os.environ.get('DESKTOP_INFERENCE') == '1'):
+            from inference import InferenceStage
+            desktop_inference = InferenceStage(get_model, get_device(), desktop_embedding_bus).start()
+        
+        session = CaptureSession(fps)
+        desktop_capture_source = session.grabber.source
+        if launcher:
+            launcher(session)
+        else:
+            desktop_stream_thread = threading.Thread(target=capture_loop, args=(session,), daemon=True)
+            desktop_stream_thread.start()
+    except Exception as e:
+        # Give the slot back, or every later start would report "Already capturing"
+        print(f"[ERROR] Capture failed to start: {e}")
+        desktop_stream_active = False
+        if desktop_inference:
+            desktop_inference.stop()
+            desktop_inference = None
+        return {"status": f"❌ Capture failed to start: {e}"}
     return {"status": "✅ Capture started"}
 
 def stop_desktop_capture():
-    global desktop_stream_active
+    global desktop_stream_active, desktop_video_encoder, desktop_inference, desktop_capture_rect
     if not desktop_stream_active:
         return {"status": "Already stopped"}
     desktop_stream_active = False
     if desktop_stream_thread:
         desktop_stream_thread.join(timeout=2.0)
+    desktop_capture_rect = None
+    if desktop_video_encoder:
+        desktop_video_encoder.close()
+        desktop_video_encoder = None
+    if desktop_inference:
+        desktop_inference.stop()
+        desktop_inference = None
     return {"status": "⏹️ Capture stopped"}
 
+# ================== NAMED CAPTURE SESSIONS ==================
+
+def main_capture_frame():
+    # (bgra, (x, y, w, h)) of the main capture's newest frame, for named sessions inside its area;
+    # None when it isn't running or has stalled, and the sessions grab for themselves
+    frame = desktop_frames.latest() if desktop_stream_active else None
+    rect = desktop_capture_rect
+    if frame is None or rect is None or frame.size != rect[2:] or time.time() - frame.timestamp > 1.0:
+        return None
+    return frame.bgra, rect
+
+# Extra regions next to the main capture; overlapping ones share one grab, and ones inside
+# the main capture's area are cut from its frames without grabbing at all (capture_manager.py)
+capture_manager = CaptureManager(FrameBus, encode_jpeg, grabber_factory=new_grabber, covering_frame=main_capture_frame)
+
+def start_named_capture(data):
+    name = str(data.get('session', '')).strip()
+    if not name or not name.replace('-', '').replace('_', '').isalnum():
+        return {"status": "❌ Session name must be letters, digits, - or _"}
+    fps = float(data.get('fps', 30))
+    quality = int(data.get('quality', 80))
+    if not 1 <= fps <= 120:
+        return {"status": "❌ FPS must be between 1 and 120"}
+    if not 1 <= quality <= 95:
+        return {"status": "❌ Quality must be between 1 and 95"}
+    if 'monitor' in data:
+        with new_grabber() as grabber:
+            monitors = grabber.monitors
+            index = int(data['monitor'])
+            if not 0 <= index < len(monitors):
+                return {"status": f"❌ Monitor must be between 0 and {len(monitors) - 1}"}
+            m = monitors[index]
+        region = (m['left'], m['top'], m['width'], m['height'])
+    else:
+        region = (int(data.get('x', 0)), int(data.get('y', 0)), int(data.get('w', 1920)), int(data.get('h', 1080)))
+    if region[2] < 64 or region[3] < 64:
+        return {"status": "❌ Region too small"}
+    try:
+        capture_manager.start(name, region, fps, quality)
+    except ValueError as e:
+        return {"status": f"⚠️ {e}"}
+    return {"status": f"✅ Capturing session {name}", "session": name,
+            "stream_url": f"/sessions/{name}/video_stream", "region": list(region)}
+
+def generate_session_stream(session):
+    last_seq = -1
+    last_write = time.monotonic()
+    yield b'--frame\r\n'
+    while capture_manager.get(session.name) is session:
+        seq, frame = session.bus.wait_for(last_seq, timeout=1.0)
+        keepalive = time.monotonic() - last_write >= STREAM_KEEPALIVE
+        if (seq == last_seq or frame is None) and not keepalive:
+            continue
+        last_seq = seq
+        yield b'Content-Type: image/jpeg\r\n\r\n' + (frame or b'') + b'\r\n--frame\r\n'
+        last_write = time.monotonic()
+
+# ================== STREAM CLIENT LIMITS ==================
+
+MAX_STREAM_CLIENTS = int(os.environ.get("MAX_STREAM_CLIENTS", 16))
+STREAM_KEEPALIVE = 5.0  # idle streams still write this often, which is how a disconnect gets noticed
+stream_slots = threading.BoundedSemaphore(MAX_STREAM_CLIENTS)
+
+def streaming_response(generator, stream, **kwargs):
+    """Response holding one of the MAX_STREAM_CLIENTS slots until the server closes it; ``stream`` labels its metrics."""
+    if not stream_slots.acquire(blocking=False):
+        generator.close()
+        return jsonify({'error': f'Too many stream viewers (max {MAX_STREAM_CLIENTS})'}), 503
+    generator = metrics.metered(generator, stream)
+    held = [True]
+
+    def release():
+        # The server closes the response when the client goes away or the generator ends
+        if held:
+            held.pop()
+            stream_slots.release()
+
+    response = Response(generator, **kwargs)
+    response.call_on_close(release)
+    return response
+
+# ================== PER-VIEWER STREAM VARIANTS ==================
+
+# Steps an adaptive viewer walks down (and back up) as its socket writes fall behind
+ADAPTIVE_LADDER = [(None, 80), (1280, 70), (960, 60), (640, 50), (480, 40)]
+DEFAULT_VARIANT = (None, 80, None)  # (max_width, quality, fps) the capture thread already encodes
+# Requested widths are rounded up to one of these, so viewers with similar screens share an encode
+VARIANT_WIDTHS = sorted(w for w, _ in ADAPTIVE_LADDER if w)
+
+def snap_width(max_width):
+    # None when the viewer can take full frames: wider than every step, or at least the captured width
+    if max_width is None:
+        return None
+    width = next((w for w in VARIANT_WIDTHS if w >= max_width), None)
+    frame = desktop_frames.latest()
+    if width is not None and frame is not None and width >= frame.size[0]:
+        return None
+    return width
+
+class StreamVariant:
+    """One shared JPEG encode for all viewers asking for the same (max_width, quality, fps)."""
+
+    def __init__(self, key):
+        self.key = key
+        self.max_width, self.quality, self.fps = key
+        self.bus = FrameBus()
+        self.viewers = 0
+
+    def run(self):
+        last_seq = -1
+        next_due = 0.0
+        while self.viewers > 0:
+            seq, frame = desktop_raw_bus.wait_for(last_seq, timeout=1.0)
+            if seq == last_seq or frame is None:
+                last_seq = seq
+                continue
+            if self.fps:
+                delay = next_due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                    seq, frame = desktop_raw_bus.latest()
+                next_due = time.monotonic() + 1.0 / self.fps
+            last_seq = seq
+            if (not self.max_width or frame.size[0] <= self.max_width) and self.quality == DEFAULT_VARIANT[1]:
+                # No downscale at the capture's quality: its JPEG is the one this would encode
+                self.bus.publish(desktop_frame_bus.latest()[1])
+                continue
+            img = frame.to_image()
+            if self.max_width and img.width > self.max_width:
+                img = img.resize((self.max_width, max(1, img.height * self.max_width // img.width)), Image.BILINEAR)
+            self.bus.publish(encode_jpeg(img, self.quality))
+
+stream_variants = {}
+stream_variants_lock = threading.Lock()
+
+def acquire_variant(key):
+    with stream_variants_lock:
+        variant = stream_variants.get(key)
+        new = variant is None
+        if new:
+            variant = stream_variants[key] = StreamVariant(key)
+        # Counted before the thread starts: run() exits as soon as it sees no viewers
+        variant.viewers += 1
+        if new:
+            threading.Thread(target=variant.run, daemon=True).start()
+        return variant
+
+def release_variant(variant):
+    with stream_variants_lock:
+        variant.viewers -= 1
+        if variant.viewers <= 0:
+            # Its encode thread notices within a second and exits
+            stream_variants.pop(variant.key, None)
+
 # MJPEG video stream (smooth "video" like Google Meet)
-def generate_video_stream():
-    while True:  # Keep streaming even if not active - shows black/empty if no frame
-        with desktop_stream_lock:
-            if desktop_last_frame:
-                buf = BytesIO()
-                desktop_last_frame.save(buf, format="JPEG", quality=80, optimize=True)
-                frame = buf.getvalue()
+def generate_video_stream(max_width=None, quality=80, fps=None, adaptive=False):
+    max_width = snap_width(max_width)
+    if adaptive:
+        ladder = []
+        for w, q in ADAPTIVE_LADDER:
+            step = (min(w, max_width) if w and max_width else (w or max_width), min(q, quality))
+            if step not in ladder:
+                ladder.append(step)
+    else:
+        ladder = [(max_width, quality)]
+    level = 0
+    variant = None
+
+    def subscribe(level):
+        nonlocal variant
+        if variant:
+            release_variant(variant)
+            variant = None
+        width, q = ladder[level]
+        key = (snap_width(width), q, fps)
+        if key == DEFAULT_VARIANT:
+            return desktop_frame_bus
+        variant = acquire_variant(key)
+        return variant.bus
+
+    bus = subscribe(level)
+    last_seq = -1
+    last_write = time.monotonic()
+    slow_writes = fast_writes = 0
+    try:
+        # Each part is closed by the next boundary right away so browsers show it without waiting for another frame
+        yield b'--frame\r\n'
+        while True:  # Keep streaming even if not active - shows black/empty if no frame
+            # Always the latest frame: a slow viewer skips frames instead of queueing them
+            seq, frame = bus.wait_for(last_seq, timeout=1.0)
+            keepalive = time.monotonic() - last_write >= STREAM_KEEPALIVE
+            if seq == last_seq and not keepalive:
+                continue
+            last_seq = seq
+            if frame is None:
+                if variant and not keepalive:
+                    continue  # its first encode is on the way
+                frame = b''  # Send empty frame if not active
+            write_start = time.monotonic()
+            yield (b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n--frame\r\n')
+            last_write = time.monotonic()
+            if not adaptive:
+                continue
+            # The generator resumes once the server has written the part to the socket
+            budget = 1.0 / (fps or desktop_stats["target_fps"])
+            if time.monotonic() - write_start > budget:
+                slow_writes, fast_writes = slow_writes + 1, 0
             else:
-                # Send empty frame if not active
-                frame = b''  # or a placeholder image
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-        time.sleep(0.033)
+                slow_writes, fast_writes = 0, fast_writes + 1
+            if slow_writes >= 3 and level < len(ladder) - 1:
+                level += 1
+            elif fast_writes >= 150 and level > 0:
+                level -= 1
+            else:
+                continue
+            bus = subscribe(level)
+            last_seq = -1
+            slow_writes = fast_writes = 0
+    finally:
+        if variant:
+            release_variant(variant)
+
+# Dirty-tile stream: a full frame first, then only the tiles that changed
+def generate_tile_stream():
+    last_seq = -1
+    applied_seq = None
+    last_write = time.monotonic()
+    while True:
+        seq, update = desktop_tile_bus.wait_for(last_seq, timeout=1.0)
+        if seq == last_seq or update is None:
+            last_seq = seq
+            if time.monotonic() - last_write >= STREAM_KEEPALIVE:
+                # Empty update, the client draws nothing
+                yield pack_tile_message(applied_seq or 0, (0, 0), [])
+                last_write = time.monotonic()
+            continue
+        last_seq = seq
+        frame_seq, base_seq, (width, height), full_jpeg, message = update
+        if applied_seq != base_seq:
+            # New viewer, or it fell behind and missed an update: resync with the whole frame
+            message = pack_tile_message(frame_seq, (width, height), [(0, 0, width, height, full_jpeg)])
+        applied_seq = frame_seq
+        yield message
+        last_write = time.monotonic()
 
 @app.route('/video_stream')
 def video_stream():
-    return Response(generate_video_stream(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    # Optional ?max_width=&quality=&fps=&adaptive=1; viewers with equal settings share one encode
+    max_width = request.args.get('max_width', type=int)
+    quality = request.args.get('quality', 80, type=int)
+    fps = request.args.get('fps', type=float)
+    adaptive = request.args.get('adaptive', '0') in ('1', 'true', 'yes')
+    if max_width is not None and max_width < 64:
+        return jsonify({'error': 'max_width must be at least 64'}), 400
+    if not 1 <= quality <= 95:
+        return jsonify({'error': 'quality must be between 1 and 95'}), 400
+    if fps is not None and not 0 < fps <= 120:
+        return jsonify({'error': 'fps must be between 0 and 120'}), 400
+    return streaming_response(generate_video_stream(max_width, quality, fps, adaptive), 'mjpeg',
+                              mimetype='multipart/x-mixed-replace; boundary=frame')
 
-@app.route('/get_stats')
-def get_stats():
+def get_video_encoder():
+    global desktop_video_encoder
+    with desktop_encoder_lock:
+        if desktop_video_encoder is None:
+            frame = desktop_frames.latest()
+            if not desktop_stream_active or frame is None:
+                return None
+            desktop_video_encoder = stream_codec.FragmentedStreamEncoder(
+                frame.size, fps=desktop_stats["target_fps"], **desktop_video_settings).start()
+        return desktop_video_encoder
+
+# H.264 fragmented MP4 stream; /video_stream stays the fallback
+@app.route('/video_stream_h264')
+def video_stream_h264():
+    if not stream_codec.ffmpeg_available():
+        return jsonify({'error': 'ffmpeg not installed - use /video_stream'}), 503
+    encoder = get_video_encoder()
+    if encoder is None or not encoder.wait_ready():
+        return jsonify({'error': 'Capture not running'}), 503
+    return streaming_response(encoder.stream(), 'h264', mimetype='video/mp4', headers={'X-Codec': encoder.codec, 'Cache-Control': 'no-store'})
+
+@app.route('/tile_stream')
+def tile_stream():
+    return streaming_response(generate_tile_stream(), 'tiles', mimetype='application/octet-stream')
+
+def desktop_stats_payload():
     region_text = f"Custom {desktop_region}" if desktop_region else "Full screen"
+    source = (desktop_capture_source if desktop_stream_active else None) or CAPTURE_SOURCE
+    if source.startswith('synthetic'):
+        region_text += f" (⚠️ {source} test pattern, not the real desktop)"
     status = "🟢 Running" if desktop_stream_active else "🔴 Stopped"
-    return jsonify({
-        "status_text": f"### 📊 Live Stats\n- **Status**: {status}\n- **FPS**: {desktop_stats['fps']:.1f}\n- **Frames**: {desktop_stats['frames']}\n- **Region**: {region_text}"
-    })
+    inference_text = ""
+    if desktop_inference:
+        inf = desktop_inference.stats
+        inference_text = f"\n- **Embeddings**: {inf['frames']} ({inf['avg_batch_ms']:.0f} ms/batch, {inf['dropped']} dropped)"
+    cache_stats = _embedding_cache.snapshot() if _embedding_cache else None
+    if cache_stats:
+        inference_text += f"\n- **Embedding cache**: {cache_stats['hit_rate']:.0%} hits ({cache_stats['memory_hits']} memory, {cache_stats['disk_hits']} disk, {cache_stats['misses']} misses)"
+    sessions = capture_manager.snapshot()
+    with desktop_stats_lock:
+        stats = dict(desktop_stats)
+    if sessions["sessions"]:
+        inference_text += "\n- **Sessions**: " + ", ".join(f"{n} {s['fps']:.0f} fps" for n, s in sessions["sessions"].items())
+    return {
+        "status_text": f"### 📊 Live Stats\n- **Status**: {status}\n- **FPS**: {stats['fps']:.1f} / {stats['target_fps']:.0f}\n- **Jitter**: {stats['jitter_ms']:.1f} ms\n- **Dropped**: {stats['frames_dropped']}\n- **Frames**: {stats['frames']}\n- **Region**: {region_text}{inference_text}",
+        "stats": stats,
+        "inference": dict(desktop_inference.stats) if desktop_inference else None,
+        "embedding_cache": cache_stats,
+        "sessions": sessions,
+        "capture_source": source
+    }
+
+@app.route('/sessions')
+def list_sessions():
+    return jsonify(capture_manager.snapshot())
+
+@app.route('/sessions', methods=['POST'])
+def start_session():
+    return jsonify(start_named_capture(request.json or {}))
+
+@app.route('/sessions/<name>/stop', methods=['POST'])
+def stop_session(name):
+    if capture_manager.stop(name):
+        return jsonify({"status": f"⏹️ Session {name} stopped"})
+    return jsonify({"status": f"Session {name} not running"}), 404
+
+@app.route('/sessions/<name>/video_stream')
+def session_video_stream(name):
+    session = capture_manager.get(name)
+    if session is None:
+        return jsonify({'error': f'Session {name} not running'}), 404
+    return streaming_response(generate_session_stream(session), 'session', mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@app.route('/get_stats')
+def get_stats():
+    return jsonify(desktop_stats_payload())
+
+def metrics_payload(fmt=None):
+    # (body, content type): Prometheus text by default, ?format=json for the same data with percentiles
+    if fmt == 'json':
+        return json.dumps(metrics.REGISTRY.to_json()), 'application/json'
+    return metrics.REGISTRY.render_prometheus(), metrics.PROMETHEUS_CONTENT_TYPE
+
+@app.route('/metrics')
+def metrics_endpoint():
+    body, content_type = metrics_payload(request.args.get('format'))
+    return Response(body, content_type=content_type)
+
+def readiness_payload():
+    # (body, status) for /ready: gates the model routes only, liveness is / (the container health check)
+    if model_ready.is_set():
+        return {"ready": True}, 200
+    if model_error:
+        return {"ready": False, "model": "failed", "error": model_error}, 503
+    return {"ready": False, "model": "loading"}, 503
+
+@app.route('/ready')
+def ready():
+    body, status = readiness_payload()
+    return jsonify(body), status
 
 @app.route('/')
 def index():
@@ -187,12 +863,41 @@ def select_region():
 
 @app.route('/start_capture', methods=['POST'])
 def start_capture():
-    return jsonify(start_desktop_capture(request.json))
+    try:
+        return jsonify(start_desktop_capture(request.json))
+    except ValueError as e:
+        return jsonify({"status": f"❌ {e}"}), 400
 
 @app.route('/stop_capture', methods=['POST'])
 def stop_capture():
     return jsonify(stop_desktop_capture())
 
+def run_production_server():
+    # Imported here so the dev profile (and Windows, where gunicorn doesn't run) doesn't need it
+    import runpy
+    from gunicorn.app.base import BaseApplication
+
+    class ProductionServer(BaseApplication):
+        def load_config(self):
+            # BaseApplication has no config-file loading (that's Application, which also parses argv);
+            # apply gunicorn.conf.py's settings the way the custom-application docs do
+            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
+            for key, value in runpy.run_path(path).items():
+                if key in self.cfg.settings and value is not None:
+                    self.cfg.set(key.lower(), value)
+
+        def load(self):
+            # Runs in the worker process
+            start_model_warmup()
+            return app
+
+    ProductionServer().run()
+
 if __name__ == '__main__':
-    port = int(os.environ.get("PORT", 5000))
-    app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
+    # SERVER_PROFILE=production runs gunicorn with gunicorn.conf.py; default is the Werkzeug dev server
+    if os.environ.get("SERVER_PROFILE", "dev") == "production":
+        run_production_server()
+    else:
+        port = int(os.environ.get("PORT", 5000))
+        start_model_warmup()
+        app.run(host='0.0.0.0', port=port, debug=False, threaded=True)
\ No newline at end of file
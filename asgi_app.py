@@ -0,0 +1,194 @@
+"""
+Asyncio (ASGI) entry point for the desktop streaming routes
+Capture and encode run in a bounded executor, frames fan out to viewers
+through per-viewer asyncio queues that drop the oldest frame when full
+
+Run with: python asgi_app.py  (or: uvicorn asgi_app:app --port 5000)
+"""
+
+import asyncio
+import contextlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.applications import Starlette
+from starlette.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import metrics
+import app as desktop  # capture pipeline, stats and JSON contract shared with the Flask app
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+# One thread owns the mss grabber (grab + encode for each frame); one more for one-off screenshots
+capture_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="capture")
+screenshot_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="screenshot")
+# Start/stop block (grabber probe, torch import, joining the inference and encoder threads); one at a time
+control_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="control")
+
+
+class AsyncFanout:
+    """Per-viewer bounded queues; a full queue drops its oldest frame instead of growing."""
+
+    def __init__(self, maxsize=2):
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._queues = set()
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=self.maxsize)
+        self._queues.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._queues.discard(queue)
+
+    @property
+    def viewers(self):
+        return len(self._queues)
+
+    def publish(self, item):
+        # Runs on the event loop thread, so no locking is needed
+        for queue in self._queues:
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(item)
+
+
+frame_fanout = AsyncFanout()
+capture_task = None
+
+
+async def run_capture(session):
+    loop = asyncio.get_running_loop()
+    try:
+        while desktop.desktop_stream_active:
+            await asyncio.sleep(session.pacer.next_delay())
+            session.pacer.mark()
+            jpeg = await loop.run_in_executor(capture_executor, session.step)
+            if jpeg is not None:
+                frame_fanout.publish(jpeg)
+    finally:
+        await loop.run_in_executor(capture_executor, session.close)
+
+
+async def video_frames():
+    queue = frame_fanout.subscribe()
+    sent = 0
+    bytes_sent = metrics.bytes_sent_total.labels('mjpeg')
+    viewers = metrics.active_viewers.labels('mjpeg')
+    viewers.inc()
+    try:
+        yield b'--frame\r\n'
+        _, frame = desktop.desktop_frame_bus.latest()
+        while True:
+            if frame is not None:
+                part = b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n--frame\r\n'
+                yield part
+                sent += len(part)
+                bytes_sent.inc(len(part))
+            try:
+                frame = await asyncio.wait_for(queue.get(), timeout=desktop.STREAM_KEEPALIVE)
+            except asyncio.TimeoutError:
+                # Idle screen: repeat the last frame so a dead connection gets noticed
+                _, frame = desktop.desktop_frame_bus.latest()
+    finally:
+        frame_fanout.unsubscribe(queue)
+        viewers.dec()
+        metrics.viewer_bytes.labels('mjpeg').observe(sent)
+
+
+async def video_stream(request):
+    if frame_fanout.viewers >= desktop.MAX_STREAM_CLIENTS:
+        return JSONResponse({'error': f'Too many stream viewers (max {desktop.MAX_STREAM_CLIENTS})'}, status_code=503)
+    # Starlette cancels the generator when the client disconnects
+    return StreamingResponse(video_frames(), media_type='multipart/x-mixed-replace; boundary=frame')
+
+
+async def start_capture(request):
+    data = await request.json()
+    loop = asyncio.get_running_loop()
+
+    def create_task(session):
+        global capture_task
+        capture_task = loop.create_task(run_capture(session))
+
+    def launch(session):
+        # Runs on the control thread; the task is created on the loop before this request resumes
+        loop.call_soon_threadsafe(create_task, session)
+
+    try:
+        result = await loop.run_in_executor(control_executor, lambda: desktop.start_desktop_capture(data, launcher=launch))
+    except ValueError as e:
+        return JSONResponse({"status": f"❌ {e}"}, status_code=400)
+    return JSONResponse(result)
+
+
+async def stop_capture(request):
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(control_executor, desktop.stop_desktop_capture)
+    if capture_task is not None:
+        await capture_task
+    return JSONResponse(result)
+
+
+async def get_stats(request):
+    return JSONResponse(desktop.desktop_stats_payload())
+
+
+async def metrics_endpoint(request):
+    body, content_type = desktop.metrics_payload(request.query_params.get('format'))
+    return Response(body, media_type=content_type)
+
+
+async def ready(request):
+    body, status = desktop.readiness_payload()
+    return JSONResponse(body, status_code=status)
+
+
+async def get_screenshot(request):
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(screenshot_executor, desktop.render_desktop_snapshot,
+                                            request.query_params, request.headers.get('if-none-match'))
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    if result is None:
+        return JSONResponse({'error': 'Failed to capture screenshot - check server logs'}, status_code=500)
+    status, body, headers = result
+    return Response(body, status_code=status, headers=headers)
+
+
+def template(name):
+    with open(os.path.join(TEMPLATE_DIR, name), encoding='utf-8') as f:
+        html = f.read()
+
+    async def endpoint(request):
+        return HTMLResponse(html)
+    return endpoint
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    desktop.start_model_warmup()
+    yield
+
+
+app = Starlette(routes=[
+    Route('/', template('index.html')),
+    Route('/select_region', template('select_region.html')),
+    Route('/get_screenshot', get_screenshot),
+    Route('/video_stream', video_stream),
+    Route('/get_stats', get_stats),
+    Route('/ready', ready),
+    Route('/metrics', metrics_endpoint),
+    Route('/start_capture', start_capture, methods=['POST']),
+    Route('/stop_capture', stop_capture, methods=['POST']),
+], lifespan=lifespan)
+
+if __name__ == '__main__':
+    import uvicorn
+
+    port = int(os.environ.get("PORT", 5000))
+    uvicorn.run(app, host='0.0.0.0', port=port)
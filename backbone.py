@@ -0,0 +1,195 @@
+"""
+Truncated ResNet50 backbone and its optional CPU inference modes
+Select with MODEL_MODE; converted models are cached under MODEL_CACHE_DIR so
+later starts load them instead of converting again. The fp32 weights themselves
+live in a local model store there too, loaded memory-mapped and fully offline
+"""
+
+import os
+import time
+
+import numpy as np
+import torch
+from torchvision.models import resnet50, ResNet50_Weights
+
+from inference import preprocess_frames
+
+# fp32          - plain eager model (default)
+# channels_last - eager model, NHWC memory format for the oneDNN conv kernels
+# torchscript   - channels_last, traced and frozen TorchScript (cached)
+# compile       - channels_last + torch.compile (inductor's own on-disk cache)
+# int8          - static INT8 quantization (FX graph mode, calibrated), traced TorchScript (cached)
+MODES = ("fp32", "channels_last", "torchscript", "compile", "int8")
+MODEL_MODE = os.environ.get("MODEL_MODE", "fp32")
+MODEL_CACHE_DIR = os.environ.get(
+    "MODEL_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "drone-localization", "models"))
+CALIBRATION_DIR = os.environ.get("MODEL_CALIBRATION_DIR")
+# Optional local torchvision checkpoint (resnet50-*.pth) to seed the store from without network access
+WEIGHTS_FILE = os.environ.get("RESNET50_WEIGHTS")
+STORE_PATH = os.path.join(MODEL_CACHE_DIR, "resnet50_trunc_fp32.pt")
+
+
+def _truncate(model):
+    return torch.nn.Sequential(*list(model.children())[:-1])
+
+
+def imagenet_state_dict(weights_file=WEIGHTS_FILE):
+    """ImageNet ResNet50 weights from weights_file, or torchvision's checkpoint cache (downloads if missing)."""
+    if weights_file:
+        return torch.load(weights_file, map_location="cpu", weights_only=True)
+    try:
+        return ResNet50_Weights.IMAGENET1K_V2.get_state_dict(progress=False)
+    except OSError as e:
+        raise RuntimeError(
+            f"ResNet50 weights are not in the model store ({STORE_PATH}) and could not be downloaded: {e}. "
+            "Set RESNET50_WEIGHTS to a local checkpoint or run scripts/build_model_store.py once online") from e
+
+
+def save_store(model, path=STORE_PATH):
+    """Write the truncated backbone's state_dict as a zip checkpoint torch.load can memory-map."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    torch.save(model.state_dict(), tmp)
+    os.replace(tmp, path)  # atomic, so a concurrent start never loads half a file
+
+
+def load_store(path=STORE_PATH):
+    """Truncated backbone straight from the store: no weight init, no copy, no network.
+
+    The module is built on the meta device (skipping ResNet50's random init) and
+    the memory-mapped tensors are assigned in place of its parameters, so pages
+    are only read from disk as the first forward pass touches them.
+    """
+    state = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    with torch.device("meta"):
+        model = _truncate(resnet50(weights=None))
+    model.load_state_dict(state, assign=True)
+    return model.eval()
+
+
+def build_backbone():
+    if os.path.exists(STORE_PATH):
+        return load_store()
+    start = time.time()
+    model = resnet50(weights=None)
+    model.load_state_dict(imagenet_state_dict())
+    model = _truncate(model).eval()
+    save_store(model)
+    print(f"[INFO] Saved fp32 backbone to the model store at {STORE_PATH} in {time.time() - start:.2f}s")
+    return model
+
+
+class ChannelsLast(torch.nn.Module):
+    """Converts the input batch to NHWC so callers can keep passing NCHW tensors."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        return self.model(x.contiguous(memory_format=torch.channels_last))
+
+
+def synthetic_images(n=32, size=224, seed=0):
+    """Deterministic RGB uint8 images: gradients, blocks and noise, loosely like desktop and map tiles."""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    images = []
+    for _ in range(n):
+        phase = rng.uniform(0, 2 * np.pi, 3)
+        img = np.stack([127 + 100 * np.sin(6 * (xx * rng.uniform(0.5, 2) + yy) + p) for p in phase], axis=-1)
+        for _ in range(rng.integers(3, 10)):
+            x0, y0 = rng.integers(0, size - 16, 2)
+            w, h = rng.integers(8, size // 2, 2)
+            img[y0:y0 + h, x0:x0 + w] = rng.uniform(0, 255, 3)
+        img += rng.normal(0, 8, img.shape)
+        images.append(np.clip(img, 0, 255).astype(np.uint8))
+    return images
+
+
+def calibration_batch(n=32, image_dir=CALIBRATION_DIR):
+    """Model-ready calibration/evaluation batch from image_dir, or the synthetic set."""
+    if image_dir and os.path.isdir(image_dir):
+        from PIL import Image
+        names = sorted(f for f in os.listdir(image_dir) if f.lower().endswith((".png", ".jpg", ".jpeg")))[:n]
+        images = [np.asarray(Image.open(os.path.join(image_dir, f)).convert("RGB")) for f in names]
+    else:
+        images = synthetic_images(n)
+    return preprocess_frames(images, order="RGB")
+
+
+def quantize_int8(model, calibration):
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    engines = torch.backends.quantized.supported_engines
+    engine = "x86" if "x86" in engines else ("fbgemm" if "fbgemm" in engines else "qnnpack")
+    torch.backends.quantized.engine = engine
+    prepared = prepare_fx(model, get_default_qconfig_mapping(engine), example_inputs=(calibration[:1],))
+    with torch.inference_mode():
+        for chunk in calibration.split(8):
+            prepared(chunk)
+    return convert_fx(prepared)
+
+
+def cache_path(mode):
+    return os.path.join(MODEL_CACHE_DIR, f"resnet50_trunc_{mode}_torch{torch.__version__.split('+')[0]}.pt")
+
+
+def _trace(model, example):
+    with torch.inference_mode():
+        traced = torch.jit.trace(model, example)
+    return torch.jit.freeze(traced.eval())
+
+
+def resolve_mode(mode=MODEL_MODE, device=torch.device("cpu")):
+    """The mode load_backbone actually runs: CPU-only modes fall back to fp32 elsewhere."""
+    if mode not in MODES:
+        raise ValueError(f"Unknown MODEL_MODE {mode!r}, expected one of {MODES}")
+    if device.type != "cpu" and mode != "fp32":
+        return "fp32"
+    return mode
+
+
+def model_version(mode=MODEL_MODE, device=torch.device("cpu")):
+    """Identifies the embeddings a mode produces, for keying cached embeddings."""
+    return os.path.splitext(os.path.basename(cache_path(resolve_mode(mode, device))))[0]
+
+
+def load_backbone(mode=MODEL_MODE, device=torch.device("cpu")):
+    """Truncated ResNet50 in the requested inference mode, converted once and cached on disk."""
+    resolved = resolve_mode(mode, device)
+    if resolved != mode:
+        print(f"[WARN] MODEL_MODE={mode} is CPU-only, using fp32 on {device}")
+        mode = resolved
+
+    start = time.time()
+    if mode in ("torchscript", "int8"):
+        path = cache_path(mode)
+        if os.path.exists(path):
+            model = torch.jit.load(path, map_location=device)
+            print(f"[INFO] Loaded cached {mode} backbone from {path} in {time.time() - start:.2f}s")
+            return model
+        example = torch.zeros(1, 3, 224, 224)
+        if mode == "int8":
+            model = ChannelsLast(quantize_int8(build_backbone(), calibration_batch()))
+        else:
+            model = ChannelsLast(build_backbone().to(memory_format=torch.channels_last))
+        model = _trace(model, example)
+        os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        torch.jit.save(model, tmp)
+        os.replace(tmp, path)  # atomic, so a concurrent start never loads half a file
+        print(f"[INFO] Built {mode} backbone in {time.time() - start:.2f}s, cached at {path}")
+        return model
+
+    model = build_backbone().to(device)
+    if mode == "fp32":
+        print(f"[INFO] Loaded fp32 backbone in {time.time() - start:.2f}s")
+        return model
+    model = ChannelsLast(model.to(memory_format=torch.channels_last)).eval()
+    if mode == "compile":
+        # Inductor keeps compiled kernels in its own cache; point it next to ours
+        os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", os.path.join(MODEL_CACHE_DIR, "inductor"))
+        model = torch.compile(model)
+    return model
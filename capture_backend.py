@@ -0,0 +1,530 @@
+"""
+Desktop capture backend used by the streaming capture thread
+Keeps one mss grabber alive instead of opening a new one per frame, and
+optionally shares the latest frames with other processes on the host;
+a deterministic synthetic source stands in for mss on headless hosts and
+in benchmarks
+"""
+
+import os
+import statistics
+import struct
+import sys
+import threading
+import time
+from collections import deque
+from multiprocessing import shared_memory
+
+import mss
+import numpy as np
+from PIL import Image
+
+SHARED_RING_NAME = os.environ.get("CAPTURE_SHM_NAME", "drone_capture_frames")
+SYNTHETIC_PATTERNS = ("moving", "static", "noise")
+SYNTHETIC_SIZE = tuple(int(v) for v in os.environ.get("SYNTHETIC_SIZE", "1920x1080").split("x"))
+
+
+class MssGrabber:
+    """Long-lived mss grabber; create and use it from a single thread (the capture loop).
+
+    Keeping one instance open reuses the display connection and, on Windows,
+    the cached capture bitmap between frames of the same size. Monitor
+    geometry is cached and only re-enumerated when the layout changes.
+    """
+
+    source = "mss"
+
+    def __init__(self, layout_check_interval=5.0):
+        self.layout_check_interval = layout_check_interval
+        self._sct = None
+        self.monitors = []
+        self._last_layout_check = 0.0
+
+    def open(self):
+        if self._sct is None:
+            self._sct = mss.mss()
+            self.monitors = [dict(m) for m in self._sct.monitors]
+            self._last_layout_check = time.monotonic()
+            print(f"[INFO] Capture monitors: {self.monitors}")
+        return self
+
+    def close(self):
+        if self._sct is not None:
+            try:
+                self._sct.close()
+            finally:
+                self._sct = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _check_layout(self):
+        # mss caches sct.monitors for the lifetime of the instance, so a short-lived
+        # probe is the only way to see a new layout; only swap instances if it differs
+        now = time.monotonic()
+        if now - self._last_layout_check < self.layout_check_interval:
+            return
+        self._last_layout_check = now
+        with mss.mss() as probe:
+            monitors = [dict(m) for m in probe.monitors]
+        if monitors != self.monitors:
+            print(f"[INFO] Display layout changed: {self.monitors} -> {monitors}")
+            self.close()
+            self.open()
+
+    def monitor_for(self, region=None):
+        if region:
+            x, y, w, h = region
+            return {"top": y, "left": x, "width": w, "height": h}
+        # Use monitor 0 (virtual/full desktop) on headless - safer than monitor[1]
+        if not self.monitors:
+            raise RuntimeError("No monitors detected by mss")
+        return self.monitors[0]
+
+    def grab(self, region=None):
+        """Grab the region (x, y, w, h) or the full desktop; returns an mss ScreenShot or None."""
+        try:
+            self.open()
+            self._check_layout()
+            return self._sct.grab(self.monitor_for(region))
+        except Exception as e:
+            print(f"[ERROR] Screenshot capture failed: {type(e).__name__}: {e}")
+            # Drop the connection so the next grab starts from a fresh one
+            self.close()
+            return None
+
+
+class SyntheticShot:
+    """The parts of an mss ScreenShot the pipeline reads: raw/bgra bytes, size, width and height."""
+
+    __slots__ = ("raw", "width", "height", "source")
+
+    def __init__(self, raw, width, height, source="synthetic"):
+        self.raw = raw
+        self.width = width
+        self.height = height
+        self.source = source  # mss shots have no such attribute; callers use getattr(shot, "source", "mss")
+
+    @property
+    def bgra(self):
+        return bytes(self.raw)
+
+    @property
+    def size(self):
+        return (self.width, self.height)
+
+
+class SyntheticGrabber:
+    """Drop-in for MssGrabber that renders frames instead of grabbing the screen.
+
+    Patterns are deterministic, so two runs see the same pixels:
+
+    - ``moving``: a desktop-like background with a window-sized box sliding
+      across it, so a small part of each frame changes (dirty-tile path)
+    - ``static``: the same frame every time (nothing changes, nothing to encode)
+    - ``noise``: full-frame seeded noise, every pixel changes (worst case)
+
+    Each grab returns a fresh buffer, like mss, so copy costs downstream match.
+    """
+
+    def __init__(self, pattern="moving", size=SYNTHETIC_SIZE, seed=0):
+        if pattern not in SYNTHETIC_PATTERNS:
+            raise ValueError(f"Unknown synthetic pattern {pattern!r}, expected one of {', '.join(SYNTHETIC_PATTERNS)}")
+        self.pattern = pattern
+        self.source = f"synthetic:{pattern}"
+        self.width, self.height = size
+        self.monitors = [{"left": 0, "top": 0, "width": self.width, "height": self.height}] * 2
+        self.frame_index = 0
+        rng = np.random.default_rng(seed)
+        w, h = self.width, self.height
+        desktop = np.empty((h, w, 4), dtype=np.uint8)
+        desktop[..., 0] = np.linspace(90, 200, w, dtype=np.uint8)[None, :]
+        desktop[..., 1] = np.linspace(60, 160, h, dtype=np.uint8)[:, None]
+        desktop[..., 2] = 40
+        desktop[..., 3] = 255
+        for _ in range(8):  # static windows with text-like speckle
+            x, y = int(rng.integers(0, w * 3 // 4)), int(rng.integers(0, h * 3 // 4))
+            ww, wh = int(rng.integers(w // 8, w // 4)), int(rng.integers(h // 8, h // 4))
+            desktop[y:y + wh, x:x + ww, :3] = 235
+            text = rng.random((wh, ww)) < 0.1
+            desktop[y:y + wh, x:x + ww, :3][text] = 30
+        self._desktop = desktop
+        self._box = (max(16, w // 6), max(16, h // 6))
+        # A short cycle of precomputed noise frames keeps generation cost out of the measurements
+        self._noise = [rng.integers(0, 256, (h, w, 4), dtype=np.uint8) for _ in range(4)] if pattern == "noise" else None
+
+    def open(self):
+        return self
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def monitor_for(self, region=None):
+        if region:
+            x, y, w, h = region
+            return {"top": y, "left": x, "width": w, "height": h}
+        return self.monitors[0]
+
+    def render(self, index):
+        """Full-desktop BGRA array for frame ``index``."""
+        if self.pattern == "static":
+            return self._desktop
+        if self.pattern == "noise":
+            return self._noise[index % len(self._noise)]
+        frame = self._desktop.copy()
+        bw, bh = self._box
+        span_x, span_y = self.width - bw, self.height - bh
+        # Bounces at 8 px/frame horizontally and 5 px/frame vertically
+        x = abs((index * 8) % (2 * span_x) - span_x) if span_x else 0
+        y = abs((index * 5) % (2 * span_y) - span_y) if span_y else 0
+        frame[y:y + bh, x:x + bw, :3] = (index * 3 % 256, 255 - index * 3 % 256, 128)
+        return frame
+
+    def grab(self, region=None):
+        m = self.monitor_for(region)
+        frame = self.render(self.frame_index)
+        self.frame_index += 1
+        x, y = max(0, m["left"]), max(0, m["top"])
+        crop = frame[y:y + m["height"], x:x + m["width"]]
+        return SyntheticShot(bytearray(crop.tobytes()), crop.shape[1], crop.shape[0], self.source)
+
+
+_auto_source = None
+
+
+def make_grabber(source="mss"):
+    """Grabber for a CAPTURE_SOURCE value: ``mss``, ``synthetic[:pattern]``, or ``auto``.
+
+    ``auto`` probes mss once and uses a moving synthetic pattern when no
+    display can be opened. Synthetic frames are opt-in only (benchmarks,
+    demos); the grabber's ``source`` says which one was picked.
+    """
+    global _auto_source
+    if source == "auto":
+        if _auto_source is None:
+            try:
+                with mss.mss() as probe:
+                    probe.grab(probe.monitors[0])
+                _auto_source = "mss"
+            except Exception as e:
+                print(f"[WARN] No display to capture ({type(e).__name__}: {e}); streaming a synthetic test pattern")
+                _auto_source = "synthetic:moving"
+        source = _auto_source
+    if source.startswith("synthetic"):
+        _, _, pattern = source.partition(":")
+        return SyntheticGrabber(pattern or "moving")
+    if source != "mss":
+        raise ValueError(f"Unknown capture source {source!r}")
+    return MssGrabber()
+
+
+class Frame:
+    """One captured frame: a read-only BGRA view into a FrameStore slot.
+
+    The view stays valid until the ring wraps around (``slots`` frames later),
+    so consumers should copy anything they keep longer than that.
+    """
+
+    __slots__ = ("seq", "timestamp", "bgra", "_image")
+
+    def __init__(self, seq, timestamp, bgra):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.bgra = bgra
+        self._image = None
+
+    @property
+    def size(self):
+        h, w = self.bgra.shape[:2]
+        return (w, h)
+
+    def to_image(self):
+        # Built on first use only; the BGRX decoder does the channel swap in the same pass
+        if self._image is None:
+            self._image = Image.frombuffer("RGB", self.size, self.bgra, "raw", "BGRX", 0, 1)
+        return self._image
+
+
+class FrameStore:
+    """Preallocated ring of BGRA frames filled straight from raw mss grabs."""
+
+    def __init__(self, slots=3):
+        self.slots = slots
+        self._ring = None
+        self._seq = 0
+        self._latest = None
+        self._lock = threading.Lock()
+
+    def write(self, screenshot, timestamp=None):
+        w, h = screenshot.size
+        src = np.frombuffer(screenshot.raw, dtype=np.uint8).reshape(h, w, 4)
+        if self._ring is None or self._ring.shape[1:] != src.shape:
+            # Region or display layout changed; frames already handed out keep the old ring alive
+            self._ring = np.empty((self.slots, h, w, 4), dtype=np.uint8)
+        seq = self._seq + 1
+        slot = self._ring[seq % self.slots]
+        np.copyto(slot, src)
+        view = slot.view()
+        view.flags.writeable = False
+        frame = Frame(seq, timestamp if timestamp is not None else time.time(), view)
+        with self._lock:
+            self._seq = seq
+            self._latest = frame
+        return frame
+
+    def latest(self):
+        with self._lock:
+            return self._latest
+
+
+class FramePacer:
+    """Deadline-based frame pacing for the capture loop.
+
+    wait() sleeps only until the next frame deadline. When a frame overruns by
+    more than one interval the missed deadlines are counted as dropped and
+    skipped, instead of bursting frames to catch up.
+    """
+
+    def __init__(self, target_fps=30.0, window=2.0):
+        self.target_fps = float(target_fps)
+        self.interval = 1.0 / self.target_fps
+        self.dropped = 0
+        self._deadline = None
+        self._last_tick = None
+        self._intervals = deque(maxlen=max(2, int(self.target_fps * window)))
+
+    def wait(self):
+        time.sleep(self.next_delay())
+        self.mark()
+
+    def next_delay(self):
+        """Seconds until the next deadline (0 when late); missed deadlines are counted and skipped."""
+        now = time.monotonic()
+        if self._deadline is None:
+            self._deadline = now
+        elif now < self._deadline:
+            return self._deadline - now
+        else:
+            missed = int((now - self._deadline) / self.interval)
+            if missed:
+                self.dropped += missed
+                self._deadline += missed * self.interval
+        return 0.0
+
+    def mark(self):
+        """Record that a frame slot started; call right after sleeping next_delay()."""
+        tick = time.monotonic()
+        if self._last_tick is not None:
+            self._intervals.append(tick - self._last_tick)
+        self._last_tick = tick
+        self._deadline += self.interval
+
+    def stats(self):
+        intervals = list(self._intervals)
+        achieved = len(intervals) / sum(intervals) if intervals else 0.0
+        jitter = statistics.pstdev(intervals) * 1000 if len(intervals) > 1 else 0.0
+        return {
+            "target_fps": self.target_fps,
+            "achieved_fps": achieved,
+            "jitter_ms": jitter,
+            "frames_dropped": self.dropped,
+        }
+
+
+class TileDiffer:
+    """Block-wise change detection between consecutive frames.
+
+    diff() returns the changed areas as (x, y, w, h) rectangles, with runs of
+    neighbouring dirty tiles in a row merged into one strip, or [] when the
+    frame is identical to the previous one. Past ``full_frame_ratio`` dirty
+    tiles it returns a single full-frame rectangle.
+    """
+
+    def __init__(self, tile=64, full_frame_ratio=0.5):
+        self.tile = tile
+        self.full_frame_ratio = full_frame_ratio
+        self._prev = None
+
+    def dirty_tiles(self, bgra):
+        # Compare whole pixels as uint32, then OR-reduce rows and columns into tile blocks
+        h, w = bgra.shape[:2]
+        cur = bgra.view(np.uint32)[..., 0]
+        changed = cur != self._prev.view(np.uint32)[..., 0]
+        rows = np.logical_or.reduceat(changed, np.arange(0, h, self.tile), axis=0)
+        return np.logical_or.reduceat(rows, np.arange(0, w, self.tile), axis=1)
+
+    def diff(self, frame):
+        bgra = frame.bgra
+        h, w = bgra.shape[:2]
+        full = [(0, 0, w, h)]
+        if self._prev is None or self._prev.shape != bgra.shape:
+            self._prev = bgra
+            return full
+        dirty = self.dirty_tiles(bgra)
+        # The previous frame is still intact in the FrameStore ring, so no copy is kept
+        self._prev = bgra
+        if not dirty.any():
+            return []
+        if dirty.mean() > self.full_frame_ratio:
+            return full
+        rects = []
+        t = self.tile
+        for ty, row in enumerate(dirty):
+            cols = np.flatnonzero(row)
+            if not len(cols):
+                continue
+            # Split the dirty columns into contiguous runs
+            runs = np.split(cols, np.flatnonzero(np.diff(cols) > 1) + 1)
+            for run in runs:
+                x, y = int(run[0]) * t, ty * t
+                rects.append((x, y, min(len(run) * t, w - x), min(t, h - y)))
+        return rects
+
+
+def _attach(name):
+    # Attach without adopting: before Python 3.13 the resource tracker would otherwise
+    # unlink the capture process's segment when this (reader) process exits
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+class SharedFrameRing:
+    """Latest captured frames in named shared memory, readable by other processes on the host.
+
+    The capture process publishes into ``slots`` fixed-size slots; readers
+    (screenshot_tool.py) map the segment by name and copy the newest slot.
+    Each slot has a seqlock counter that is odd while the writer is inside
+    it, so a reader retries instead of returning a torn frame. The segment
+    is recreated larger if a frame outgrows it, and removed by close().
+    The header also carries a heartbeat the capture refreshes on every
+    grab, so a static screen stays servable long after its last change,
+    plus the grabber's source and primary monitor, so a reader can cut
+    that monitor out and label the frame without opening mss itself.
+    """
+
+    MAGIC = b"DLFRAME3"
+    # magic, slots, slot_bytes, latest slot (-1 before the first frame), heartbeat (time.time() of the last grab),
+    # grabber source, primary monitor left, top, width, height (width 0 until the capture reports it)
+    _HEADER = struct.Struct("<8sIIqd32siiII")
+    _META = struct.Struct("<QqiiIId")  # seqlock, frame seq, left, top, width, height, timestamp
+    _META_BYTES = 64
+
+    def __init__(self, name=SHARED_RING_NAME, slots=2, source="mss"):
+        self.name = name
+        self.slots = slots
+        self.source = source
+        self.screen = (0, 0, 0, 0)
+        self._shm = None
+        self._slot_bytes = 0
+        self._latest = -1
+
+    def _slot_offset(self, index):
+        return self._HEADER.size + index * (self._META_BYTES + self._slot_bytes)
+
+    def _create(self, slot_bytes):
+        self.close()
+        try:
+            # Left behind by a process that didn't shut down cleanly
+            stale = shared_memory.SharedMemory(name=self.name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+        self._slot_bytes = slot_bytes
+        size = self._HEADER.size + self.slots * (self._META_BYTES + slot_bytes)
+        self._shm = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+        self._latest = -1
+        self._write_header()
+
+    def _write_header(self):
+        self._HEADER.pack_into(self._shm.buf, 0, self.MAGIC, self.slots, self._slot_bytes, self._latest,
+                               time.time(), self.source.encode()[:32], *self.screen)
+
+    def publish(self, frame, origin=(0, 0), screen=None):
+        """Copy a Frame into the next slot; ``origin`` is its top-left in desktop coordinates.
+
+        ``screen`` is the grabber's primary monitor (an mss monitor dict), kept until the next one given.
+        """
+        if screen is not None:
+            self.screen = (screen["left"], screen["top"], screen["width"], screen["height"])
+        nbytes = frame.bgra.nbytes
+        if self._shm is None or nbytes > self._slot_bytes:
+            self._create(nbytes)
+        index = (self._latest + 1) % self.slots
+        offset = self._slot_offset(index)
+        buf = self._shm.buf
+        counter = self._META.unpack_from(buf, offset)[0]
+        self._META.pack_into(buf, offset, counter + 1, 0, 0, 0, 0, 0, 0.0)
+        start = offset + self._META_BYTES
+        np.frombuffer(buf, dtype=np.uint8, count=nbytes, offset=start)[:] = frame.bgra.reshape(-1)
+        w, h = frame.size
+        self._META.pack_into(buf, offset, counter + 2, frame.seq, origin[0], origin[1], w, h, frame.timestamp)
+        self._latest = index
+        self._write_header()
+
+    def touch(self):
+        """Mark the latest frame as still current: the capture grabbed again and nothing changed."""
+        if self._shm is not None:
+            self._write_header()
+
+    def close(self):
+        if self._shm is not None:
+            shm, self._shm = self._shm, None
+            shm.close()
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    @classmethod
+    def read_latest(cls, name=SHARED_RING_NAME, max_age=2.0, retries=3):
+        """(info, bgra bytes) of the newest frame, or None if nothing recent is published.
+
+        info has seq, left, top, width and height, the grabber's ``source``
+        and its primary monitor as ``screen`` (an mss monitor dict, None if
+        not reported). The frame is ignored when
+        the capture hasn't grabbed for ``max_age`` seconds, so a stalled or
+        stopped capture isn't served; an unchanged screen keeps it current.
+        """
+        try:
+            shm = _attach(name)
+        except FileNotFoundError:
+            return None
+        try:
+            buf = shm.buf
+            magic, slots, slot_bytes, latest, heartbeat, source, *screen = cls._HEADER.unpack_from(buf, 0)
+            if magic != cls.MAGIC or latest < 0 or time.time() - heartbeat > max_age:
+                return None
+            offset = cls._HEADER.size + latest * (cls._META_BYTES + slot_bytes)
+            for _ in range(retries):
+                before, seq, left, top, w, h, _ = cls._META.unpack_from(buf, offset)
+                if before % 2:
+                    time.sleep(0.001)
+                    continue
+                start = offset + cls._META_BYTES
+                data = bytes(buf[start:start + w * h * 4])
+                if cls._META.unpack_from(buf, offset)[0] == before:
+                    info = {"seq": seq, "left": left, "top": top, "width": w, "height": h,
+                            "source": source.rstrip(b"\0").decode(),
+                            "screen": dict(zip(("left", "top", "width", "height"), screen)) if screen[2] else None}
+                    return info, data
+            return None
+        finally:
+            del buf
+            shm.close()
@@ -0,0 +1,246 @@
+"""
+Several named capture sessions on one grab loop
+Sessions inside the main capture's area are cut from its latest frame, and
+sessions whose regions overlap are served from a single grab of the union
+of their regions, cut out with NumPy slicing, so grab cost follows the
+captured area rather than the number of sessions; each session encodes on
+its own thread at its own fps and publishes on its own bus
+"""
+
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from capture_backend import MssGrabber
+
+MAX_SESSIONS = 8
+
+
+def union(rects):
+    x0 = min(r[0] for r in rects)
+    y0 = min(r[1] for r in rects)
+    x1 = max(r[0] + r[2] for r in rects)
+    y1 = max(r[1] + r[3] for r in rects)
+    return (x0, y0, x1 - x0, y1 - y0)
+
+
+def overlaps(a, b):
+    return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+
+def contains(outer, inner):
+    return (outer[0] <= inner[0] and outer[1] <= inner[1]
+            and inner[0] + inner[2] <= outer[0] + outer[2] and inner[1] + inner[3] <= outer[1] + outer[3])
+
+
+def group_regions(sessions):
+    """Sessions grouped so that each group's regions overlap (transitively); one grab per group."""
+    groups = []
+    for session in sessions:
+        merged = [g for g in groups if any(overlaps(session.region, s.region) for s in g)]
+        group = [session]
+        for g in merged:
+            group += g
+            groups.remove(g)
+        groups.append(group)
+    return groups
+
+
+class ManagedSession:
+    """One named region: paced by its own fps, encoded on its own thread.
+
+    The grab loop hands it the newest slice through offer(); if the encoder
+    is still busy with the previous one, the older slice is replaced, so a
+    slow session drops frames without holding up the grab loop.
+    """
+
+    def __init__(self, name, region, fps, bus, encode, quality=80):
+        self.name = name
+        self.region = region
+        self.fps = fps
+        self.bus = bus
+        self.encode = encode
+        self.quality = quality
+        self.next_due = time.monotonic()
+        self.stats = {"fps": 0.0, "frames": 0, "target_fps": fps, "dropped": 0, "encode_ms": 0.0,
+                      "shared_grabs": 0, "region": list(region)}
+        self._prev = None
+        self._pending = None
+        self._cond = threading.Condition()
+        self._active = True
+        self._window_start = time.monotonic()
+        self._window_frames = 0
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"capture-{name}")
+        self._thread.start()
+
+    def due(self, now):
+        # A quarter interval early still counts, so overlapping sessions with close
+        # deadlines land in the same grab instead of two grabs moments apart
+        return now >= self.next_due - 0.25 / self.fps
+
+    def schedule(self, now):
+        interval = 1.0 / self.fps
+        self.next_due += interval
+        if self.next_due < now:
+            # Fell behind (slow grabs): skip the missed deadlines instead of bursting
+            missed = int((now - self.next_due) / interval) + 1
+            self.stats["dropped"] += missed
+            self.next_due += missed * interval
+
+    def offer(self, bgra, shared):
+        with self._cond:
+            if self._pending is not None:
+                self.stats["dropped"] += 1
+            self._pending = bgra
+            self._cond.notify()
+        if shared:
+            self.stats["shared_grabs"] += 1
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending is not None or not self._active, timeout=1.0)
+                if not self._active:
+                    return
+                bgra, self._pending = self._pending, None
+            if bgra is None:
+                continue
+            frame = np.ascontiguousarray(bgra)
+            self._window_frames += 1
+            prev, self._prev = self._prev, frame
+            # Static region: viewers keep the last JPEG, nothing to encode
+            if prev is None or prev.shape != frame.shape or not np.array_equal(prev, frame):
+                start = time.perf_counter()
+                h, w = frame.shape[:2]
+                img = Image.frombuffer("RGB", (w, h), frame, "raw", "BGRX", 0, 1)
+                self.bus.publish(self.encode(img, self.quality))
+                elapsed = (time.perf_counter() - start) * 1000
+                self.stats["encode_ms"] += (elapsed - self.stats["encode_ms"]) * 0.1
+            now = time.monotonic()
+            if now - self._window_start >= 1.0:
+                self.stats["fps"] = self._window_frames / (now - self._window_start)
+                self.stats["frames"] += self._window_frames
+                self._window_start, self._window_frames = now, 0
+
+    def stop(self):
+        with self._cond:
+            self._active = False
+            self._cond.notify()
+        self._thread.join(timeout=2.0)
+
+
+class CaptureManager:
+    """Runs named ManagedSessions from one grab thread.
+
+    Each tick only the sessions whose deadline has passed are served.
+    ``covering_frame()`` may return (bgra, (x, y, w, h)) of a frame another
+    capture already grabbed (app.py's main capture); sessions inside it get
+    a copy of their slice. The rest are grouped by overlapping regions,
+    every group is grabbed once as the union rectangle, and each session
+    gets its slice of it as a view.
+    """
+
+    def __init__(self, bus_factory, encode, max_sessions=MAX_SESSIONS, grabber_factory=MssGrabber,
+                 covering_frame=None):
+        self.bus_factory = bus_factory
+        self.grabber_factory = grabber_factory
+        self.covering_frame = covering_frame
+        self.encode = encode
+        self.max_sessions = max_sessions
+        self.sessions = {}
+        self.stats = {"grabs": 0, "grab_ms": 0.0, "grabbed_pixels": 0, "requested_pixels": 0, "reused_frames": 0}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self, name, region, fps, quality=80):
+        """Start session ``name`` on region (x, y, w, h); returns it, or raises ValueError."""
+        with self._lock:
+            if name in self.sessions:
+                raise ValueError(f"Session {name!r} is already capturing")
+            if len(self.sessions) >= self.max_sessions:
+                raise ValueError(f"Too many capture sessions (max {self.max_sessions})")
+            session = ManagedSession(name, tuple(region), fps, self.bus_factory(), self.encode, quality)
+            self.sessions[name] = session
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name="capture-manager")
+                self._thread.start()
+        self._wake.set()
+        return session
+
+    def stop(self, name):
+        with self._lock:
+            session = self.sessions.pop(name, None)
+        if session is None:
+            return False
+        session.stop()
+        return True
+
+    def get(self, name):
+        with self._lock:
+            return self.sessions.get(name)
+
+    def snapshot(self):
+        with self._lock:
+            sessions = {name: dict(s.stats) for name, s in self.sessions.items()}
+        return {"sessions": sessions, "grab": dict(self.stats)}
+
+    def _run(self):
+        grabber = self.grabber_factory()
+        try:
+            while True:
+                with self._lock:
+                    sessions = list(self.sessions.values())
+                    if not sessions:
+                        self._thread = None  # the next start() launches a new loop
+                        return
+                now = time.monotonic()
+                due = [s for s in sessions if s.due(now)]
+                if not due:
+                    self._wake.clear()
+                    self._wake.wait(max(0.0, min(s.next_due for s in sessions) - now))
+                    continue
+                for group in group_regions(self._reuse_covering(due)):
+                    self._grab_group(grabber, group)
+                now = time.monotonic()
+                for session in due:
+                    session.schedule(now)
+        finally:
+            grabber.close()
+
+    def _reuse_covering(self, due):
+        # Serves sessions inside the covering frame; returns the ones that still need a grab
+        covering = self.covering_frame() if self.covering_frame else None
+        if covering is None:
+            return due
+        frame, rect = covering
+        rest = []
+        for session in due:
+            if not contains(rect, session.region):
+                rest.append(session)
+                continue
+            x, y, w, h = session.region
+            # Copied: the frame belongs to the other capture's ring and is reused a few frames later
+            session.offer(frame[y - rect[1]:y - rect[1] + h, x - rect[0]:x - rect[0] + w].copy(), shared=True)
+            self.stats["reused_frames"] += 1
+            self.stats["requested_pixels"] += w * h
+        return rest
+
+    def _grab_group(self, grabber, group):
+        ux, uy, uw, uh = union([s.region for s in group])
+        start = time.perf_counter()
+        shot = grabber.grab((ux, uy, uw, uh))
+        if shot is None:
+            return
+        elapsed = (time.perf_counter() - start) * 1000
+        stats = self.stats
+        stats["grabs"] += 1
+        stats["grab_ms"] += (elapsed - stats["grab_ms"]) * 0.1
+        stats["grabbed_pixels"] += uw * uh
+        frame = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+        for session in group:
+            x, y, w, h = session.region
+            stats["requested_pixels"] += w * h
+            session.offer(frame[y - uy:y - uy + h, x - ux:x - ux + w], shared=len(group) > 1)
@@ -0,0 +1,148 @@
+"""
+Two-tier embedding cache
+Embeddings are keyed by the SHA-256 of the tile's encoded bytes, the
+augmentation applied and the model version, so repeated and overlapping
+searches skip the backbone; an in-memory LRU sits in front of a SQLite file
+shared by every process on the host
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+EMBEDDING_CACHE_DIR = os.environ.get(
+    "EMBEDDING_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "drone-localization", "embeddings"))
+EMBEDDING_CACHE_BYTES = int(os.environ.get("EMBEDDING_CACHE_MB", 256)) * 1024 * 1024
+EMBEDDING_MEMORY_ENTRIES = int(os.environ.get("EMBEDDING_MEMORY_ENTRIES", 4096))
+
+
+def cache_key(content, augmentation="none", model_version=""):
+    """Key for the embedding of ``content`` (encoded tile bytes) after ``augmentation`` under ``model_version``."""
+    return f"{hashlib.sha256(content).hexdigest()}:{augmentation}:{model_version}"
+
+
+class EmbeddingCache:
+    """Memory LRU -> SQLite, for float32 embedding vectors.
+
+    The disk tier stores each vector as a BLOB with its last access time and
+    evicts least recently used rows down to 90% once it holds more than
+    ``max_bytes``. WAL mode lets several processes read while one writes.
+    """
+
+    def __init__(self, root=EMBEDDING_CACHE_DIR, max_bytes=EMBEDDING_CACHE_BYTES,
+                 memory_entries=EMBEDDING_MEMORY_ENTRIES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        os.makedirs(root, exist_ok=True)
+        self._db().execute("""CREATE TABLE IF NOT EXISTS embeddings (
+            key TEXT PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, atime REAL NOT NULL)""")
+
+    def _db(self):
+        # One connection per thread; sqlite3 connections can't be shared across threads
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(os.path.join(self.root, "embeddings.sqlite"), timeout=30.0, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _remember(self, key, vector):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get_many(self, keys):
+        """{key: float32 vector} for the keys that are cached."""
+        found, missing = {}, []
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is None:
+                    missing.append(key)
+                else:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+        self.stats["memory_hits"] += len(found)
+        if missing:
+            db = self._db()
+            rows = []
+            # SQLite caps bound parameters per statement; query in chunks
+            for i in range(0, len(missing), 500):
+                chunk = missing[i:i + 500]
+                rows += db.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                                   chunk).fetchall()
+            if rows:
+                now = time.time()
+                db.executemany("UPDATE embeddings SET atime=? WHERE key=?", [(now, key) for key, _ in rows])
+            for key, blob in rows:
+                vector = np.frombuffer(blob, dtype=np.float32)
+                self._remember(key, vector)
+                found[key] = vector
+            self.stats["disk_hits"] += len(rows)
+            self.stats["misses"] += len(missing) - len(rows)
+        return found
+
+    def put_many(self, items):
+        """Store {key: vector} in both tiers."""
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for key, vector in items.items():
+            vector = np.ascontiguousarray(vector, dtype=np.float32)
+            self._remember(key, vector)
+            rows.append((key, vector.tobytes(), vector.nbytes, now))
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.executemany("INSERT OR REPLACE INTO embeddings (key, vector, size, atime) VALUES (?, ?, ?, ?)", rows)
+            self._evict(db)
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def _evict(self, db):
+        total, = db.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        victims = []
+        for key, size in db.execute("SELECT key, size FROM embeddings ORDER BY atime"):
+            if total <= target:
+                break
+            victims.append((key,))
+            total -= size
+        db.executemany("DELETE FROM embeddings WHERE key=?", victims)
+
+    def get_or_compute(self, keys, compute):
+        """Vectors for ``keys`` in order; ``compute(indices)`` -> (len(indices), D) array fills the misses."""
+        found = self.get_many(keys)
+        missing = [i for i, key in enumerate(keys) if key not in found]
+        if missing:
+            computed = np.asarray(compute(missing), dtype=np.float32)
+            self.put_many({keys[i]: vector for i, vector in zip(missing, computed)})
+            found.update((keys[i], vector) for i, vector in zip(missing, computed))
+        if not keys:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack([found[key] for key in keys])
+
+    def snapshot(self):
+        stats = dict(self.stats)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        stats["memory_entries"] = len(self._memory)
+        return stats
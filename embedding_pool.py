@@ -0,0 +1,215 @@
+"""
+Process-pool embedding engine
+Persistent worker processes each load the backbone once and embed batches
+of RGB tiles handed over through shared memory, so preprocessing and
+inference run outside the server's GIL and every core gets used; torch's
+intra-op threads are split between the workers instead of oversubscribed
+"""
+
+import os
+import queue
+import threading
+from collections import deque
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+
+EMBED_DIM = 2048
+DEFAULT_WORKERS = int(os.environ.get("EMBEDDING_WORKERS", 0))
+
+
+def _worker_main(conn, in_name, out_name, threads, mode):
+    import torch
+
+    torch.set_num_threads(threads)
+    import backbone
+    from inference import preprocess_frames
+
+    in_shm = shared_memory.SharedMemory(name=in_name)
+    out_shm = shared_memory.SharedMemory(name=out_name)
+    model = backbone.load_backbone(mode or backbone.MODEL_MODE)
+    with torch.inference_mode():
+        model(torch.zeros(1, 3, 224, 224))
+    conn.send(("ready", os.getpid()))
+    while True:
+        shapes = conn.recv()
+        if shapes is None:
+            break
+        try:
+            frames, offset = [], 0
+            for shape in shapes:
+                frames.append(np.ndarray(shape, dtype=np.uint8, buffer=in_shm.buf, offset=offset))
+                offset += int(np.prod(shape))
+            with torch.inference_mode():
+                embeddings = model(preprocess_frames(frames, order="RGB")).flatten(1).float().numpy()
+            np.ndarray(embeddings.shape, dtype=np.float32, buffer=out_shm.buf)[:] = embeddings
+            del frames
+            conn.send(("ok", len(shapes)))
+        except Exception as e:
+            conn.send(("error", repr(e)))
+    in_shm.close()
+    out_shm.close()
+
+
+class _Worker:
+    def __init__(self, process, conn, in_shm, out_shm):
+        self.process = process
+        self.conn = conn
+        self.in_shm = in_shm
+        self.out_shm = out_shm
+
+
+class EmbeddingPool:
+    """Embeds (H, W, 3) uint8 RGB images on ``workers`` persistent processes.
+
+    Each worker owns two shared-memory blocks: an input area that holds up
+    to ``max_batch`` images of at most ``max_side`` x ``max_side`` packed
+    back to back, and an output area for their (max_batch, 2048) float32
+    embeddings. Only the image shapes travel over the worker's pipe. A call
+    to embed() splits the images across idle workers and blocks until all
+    chunks are back; it is safe to call from several threads. A worker that
+    dies is replaced by a fresh one; a chunk it was working on fails the
+    call with RuntimeError.
+    """
+
+    def __init__(self, workers=None, threads_per_worker=None, max_batch=32, max_side=512, mode=None):
+        workers = workers or DEFAULT_WORKERS or max(1, (os.cpu_count() or 2) // 2)
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        self.max_batch = max_batch
+        self.max_side = max_side
+        self.mode = mode
+        self.restarts = 0
+        self._ctx = get_context("spawn")  # fork would copy the parent's torch threads and locks
+        self._lock = threading.Lock()
+        self._workers = [self._spawn() for _ in range(workers)]
+        self._idle = queue.Queue()
+        for worker in self._workers:
+            self._wait_ready(worker)  # blocks until the worker's model is loaded and warm
+            self._idle.put(worker)
+
+    def _spawn(self):
+        in_shm = shared_memory.SharedMemory(create=True, size=self.max_batch * self.max_side * self.max_side * 3)
+        out_shm = shared_memory.SharedMemory(create=True, size=self.max_batch * EMBED_DIM * 4)
+        conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(target=_worker_main, daemon=True,
+                                    args=(child_conn, in_shm.name, out_shm.name, self.threads_per_worker, self.mode))
+        process.start()
+        child_conn.close()  # only the worker holds its end, so its death shows up as EOFError here
+        return _Worker(process, conn, in_shm, out_shm)
+
+    def _wait_ready(self, worker):
+        try:
+            worker.conn.recv()
+        except (EOFError, OSError):
+            self._release(worker)
+            raise RuntimeError(f"Embedding worker {worker.process.pid} exited while loading the model "
+                               f"(exit code {worker.process.exitcode})") from None
+
+    def _release(self, worker):
+        worker.conn.close()
+        worker.process.join(timeout=1.0)
+        if worker.process.is_alive():
+            worker.process.terminate()
+        for shm in (worker.in_shm, worker.out_shm):
+            shm.close()
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _replace(self, worker):
+        """A fresh worker in place of a dead one; raises RuntimeError (keeping the old one listed) if it won't start."""
+        print(f"[WARN] Embedding worker {worker.process.pid} died (exit code {worker.process.exitcode}), restarting it")
+        fresh = self._spawn()
+        self._wait_ready(fresh)
+        with self._lock:
+            self._workers[self._workers.index(worker)] = fresh
+            self.restarts += 1
+        self._release(worker)
+        return fresh
+
+    @property
+    def workers(self):
+        return len(self._workers)
+
+    def embed(self, images):
+        """(N, 2048) float32 embeddings of RGB uint8 images (arrays or PIL images)."""
+        arrays = [np.ascontiguousarray(np.asarray(img)[..., :3], dtype=np.uint8) for img in images]
+        for arr in arrays:
+            if arr.ndim != 3 or max(arr.shape[:2]) > self.max_side:
+                raise ValueError(f"Expected (H, W, 3) images up to {self.max_side}px, got {arr.shape}")
+        out = np.empty((len(arrays), EMBED_DIM), dtype=np.float32)
+        # Spread a call over all workers, but never past a worker's batch capacity
+        chunk = max(1, min(self.max_batch, -(-len(arrays) // self.workers)))
+        pending = deque()
+        error = None
+        try:
+            for start in range(0, len(arrays), chunk):
+                while True:
+                    try:
+                        worker = self._idle.get_nowait()
+                        break
+                    except queue.Empty:
+                        if not pending:
+                            worker = self._idle.get()
+                            break
+                        self._collect(pending.popleft(), out)
+                try:
+                    worker = self._dispatch(worker, arrays[start:start + chunk])
+                except Exception:
+                    self._idle.put(worker)  # a dead one is replaced on its next dispatch
+                    raise
+                pending.append((worker, start))
+        finally:
+            # Hand every busy worker back, even if a chunk failed
+            while pending:
+                try:
+                    self._collect(pending.popleft(), out)
+                except (RuntimeError, EOFError, OSError) as e:
+                    error = error or e
+        if error:
+            raise error
+        return out
+
+    def _dispatch(self, worker, arrays):
+        # Returns the worker the chunk went to: a replacement if this one had died while idle
+        if not worker.process.is_alive():
+            worker = self._replace(worker)
+        offset = 0
+        for arr in arrays:
+            worker.in_shm.buf[offset:offset + arr.nbytes] = arr.reshape(-1)
+            offset += arr.nbytes
+        try:
+            worker.conn.send([arr.shape for arr in arrays])
+        except OSError:
+            # Died between the liveness check and the send; its input area goes with it
+            worker = self._replace(worker)
+            return self._dispatch(worker, arrays)
+        return worker
+
+    def _collect(self, job, out):
+        worker, start = job
+        try:
+            try:
+                status, info = worker.conn.recv()
+            except (EOFError, OSError):
+                pid, code = worker.process.pid, worker.process.exitcode
+                worker = self._replace(worker)
+                raise RuntimeError(f"Embedding worker {pid} died mid-batch (exit code {code}); it was restarted") from None
+            if status != "ok":
+                raise RuntimeError(f"Embedding worker {worker.process.pid} failed: {info}")
+            out[start:start + info] = np.ndarray((info, EMBED_DIM), dtype=np.float32, buffer=worker.out_shm.buf)
+        finally:
+            self._idle.put(worker)
+
+    def close(self):
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+        for worker in workers:
+            worker.process.join(timeout=5.0)
+            self._release(worker)
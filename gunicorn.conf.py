@@ -0,0 +1,21 @@
+"""
+Gunicorn settings for the production serving profile (SERVER_PROFILE=production)
+One worker process: capture state and the frame buses live in that process,
+so concurrency comes from a bounded thread pool instead of more workers
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = 1
+worker_class = "gthread"
+
+# Every stream viewer holds a thread for as long as it watches; keep some for the JSON routes
+_max_stream_clients = int(os.environ.get("MAX_STREAM_CLIENTS", 16))
+threads = int(os.environ.get("WEB_THREADS", _max_stream_clients + 8))
+
+# gthread workers heartbeat from their main loop, so long-lived streams don't trip this
+timeout = 30
+graceful_timeout = 5
+keepalive = 5
+accesslog = "-"
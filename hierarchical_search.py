@@ -0,0 +1,106 @@
+"""
+Coarse-to-fine localization across zoom levels
+The search area is first covered by a handful of low-zoom tiles; each level
+keeps the best ``beam`` tiles and descends into their children, so a search
+costs about beam * 4 tiles per zoom level instead of every tile of an N x N
+grid at the target zoom
+"""
+
+import math
+import os
+import time
+
+import numpy as np
+
+from tile_cache import latlon_to_tile
+from tile_index import normalize
+
+# Same limit as the grid search: stop with partial results, leaving 5 s of the 60 s request
+PROCESSING_BUDGET = float(os.environ.get("LOCALIZATION_BUDGET", 55.0))
+EARTH_CIRCUMFERENCE = 40075016.686
+METERS_PER_DEGREE = 111320.0
+
+
+def tile_width_m(zoom, lat):
+    return EARTH_CIRCUMFERENCE * math.cos(math.radians(lat)) / 2 ** zoom
+
+
+def coarse_zoom(lat, radius_m, coarse_grid=4, max_zoom=18):
+    """Highest zoom at which the radius still fits in about coarse_grid x coarse_grid tiles."""
+    span = EARTH_CIRCUMFERENCE * math.cos(math.radians(lat)) * max(coarse_grid - 1, 1) / (2 * radius_m)
+    return max(1, min(max_zoom, int(math.floor(math.log2(max(span, 1.0))))))
+
+
+def covering_tiles(lat, lon, radius_m, zoom):
+    """Tiles at ``zoom`` covering the square of half-width radius_m around lat/lon."""
+    dlat = radius_m / METERS_PER_DEGREE
+    dlon = radius_m / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+    x0, y0 = latlon_to_tile(lat + dlat, lon - dlon, zoom)
+    x1, y1 = latlon_to_tile(lat - dlat, lon + dlon, zoom)
+    return [(zoom, x, y) for y in range(y0, y1 + 1) for x in range(x0, x1 + 1)]
+
+
+def children(tile, levels=1):
+    z, x, y = tile
+    n = 2 ** levels
+    return [(z + levels, x * n + dx, y * n + dy) for dy in range(n) for dx in range(n)]
+
+
+def hierarchical_search(query_embedding, lat, lon, radius_m, embed_tiles, target_zoom=18, beam=4,
+                        zoom_step=1, coarse_grid=4, k=5, budget=PROCESSING_BUDGET):
+    """Best target-zoom tiles for one query embedding.
+
+    ``embed_tiles(tiles)`` returns (tiles_found, embeddings[N, D]) and may
+    drop tiles it couldn't download. Levels run until ``target_zoom`` or
+    until the next level, judged by how long the last one took, would not
+    finish inside ``budget`` seconds; the result is then partial and ranks
+    the deepest level reached. A level where no tile could be embedded also
+    ends the search as partial, with the level above it as the matches.
+
+    Returns {"matches": [(cosine, (z, x, y)), ...], "zoom": zoom of the
+    matches (None without any), "partial": bool,
+    "levels": [{"zoom", "tiles", "embedded", "seconds", "best"}, ...], "tiles_scored": int}.
+    """
+    start = time.time()
+    query = normalize(query_embedding).reshape(-1)
+    zoom = min(coarse_zoom(lat, radius_m, coarse_grid, target_zoom), target_zoom)
+    candidates = covering_tiles(lat, lon, radius_m, zoom)
+    levels = []
+    ranked = []  # the deepest level that produced scores
+    ranked_zoom = None
+    partial = False
+    while candidates:
+        level_start = time.time()
+        tiles, embeddings = embed_tiles(candidates)
+        level_ranked = []
+        if len(tiles):
+            scores = normalize(embeddings) @ query
+            order = np.argsort(-scores)
+            level_ranked = [(float(scores[i]), tuple(tiles[i])) for i in order]
+        level_s = time.time() - level_start
+        levels.append({"zoom": zoom, "tiles": len(candidates), "embedded": len(level_ranked), "seconds": level_s,
+                       "best": level_ranked[0][0] if level_ranked else None})
+        if not level_ranked:
+            # Nothing at this zoom could be embedded (tiles unavailable): stop rather than expand stale tiles
+            partial = True
+            print(f"⚠️ No tiles embedded at zoom {zoom}, returning partial results")
+            break
+        ranked, ranked_zoom = level_ranked, zoom
+        if zoom >= target_zoom:
+            break
+        step = min(zoom_step, target_zoom - zoom)
+        # Children per level grow 4**step times; assume time grows the same way
+        next_estimate = level_s * (4 ** step) * beam / max(len(candidates), 1)
+        if time.time() - start + next_estimate > budget:
+            partial = True
+            print(f"⏱️ Processing budget reached at zoom {zoom}, returning partial results")
+            break
+        candidates = [child for _, tile in ranked[:beam] for child in children(tile, step)]
+        zoom += step
+    return {
+        "matches": ranked[:k],
+        "zoom": ranked_zoom,
+        "partial": partial,
+        "levels": levels,
+        "tiles_scored": sum(level["tiles"] for level in levels),
+    }
@@ -0,0 +1,194 @@
+"""
+Background embedding stage for captured desktop frames
+Frames arrive through a bounded queue and are micro-batched through the
+truncated ResNet50 on a separate thread, so capture fps is not affected
+"""
+
+import os
+import queue
+import threading
+import time
+import warnings
+
+import numpy as np
+import torch
+import torchvision.transforms.v2.functional as TF
+
+import metrics
+
+DEFAULT_THREADS = int(os.environ.get("INFERENCE_THREADS", max(1, (os.cpu_count() or 2) // 2)))
+
+INPUT_SIZE = 224
+IMAGENET_MEAN = torch.tensor([0.485, 0.456, 0.406]).view(1, 3, 1, 1)
+IMAGENET_STD = torch.tensor([0.229, 0.224, 0.225]).view(1, 3, 1, 1)
+# ToTensor + Normalize folded into one multiply-add: x * scale + bias
+_NORM_SCALE = 1.0 / (255.0 * IMAGENET_STD)
+_NORM_BIAS = -IMAGENET_MEAN / IMAGENET_STD
+
+
+def _as_array(frame):
+    # mss ScreenShot, capture_backend.Frame or an (H, W, C) uint8 array
+    if hasattr(frame, "raw") and hasattr(frame, "size"):
+        w, h = frame.size
+        return np.frombuffer(frame.raw, dtype=np.uint8).reshape(h, w, 4)
+    if hasattr(frame, "bgra"):
+        return frame.bgra
+    return np.asarray(frame)
+
+
+def resize_frame(frame, size=INPUT_SIZE):
+    """Full-size uint8 frame -> (C, size, size) uint8 tensor, without copying the full frame.
+
+    The HWC array is wrapped as a channels_last tensor, which is the layout the
+    uint8 antialiased resize kernel works on directly.
+    """
+    with warnings.catch_warnings():
+        # Ring views are read-only; the resize only reads them
+        warnings.simplefilter("ignore", UserWarning)
+        view = torch.from_numpy(_as_array(frame)).permute(2, 0, 1).unsqueeze(0)
+    return TF.resize(view, [size, size], antialias=True)[0]
+
+
+def normalize_batch(resized, order="BGRA"):
+    """Stacked (N, C, H, W) uint8 -> ImageNet-normalized float32 (N, 3, H, W) RGB."""
+    rgb = resized[:, [2, 1, 0]] if order in ("BGRA", "BGRX", "BGR") else resized[:, :3]
+    return torch.addcmul(_NORM_BIAS, rgb.float(), _NORM_SCALE)
+
+
+def preprocess_frames(frames, order="BGRA", size=INPUT_SIZE):
+    """Raw frames (mss grabs, ring Frames or HWC uint8 arrays) -> model input batch.
+
+    Vectorized replacement for app.preprocess: uint8 resize first, then channel
+    swap, float conversion and normalization as one batched operation.
+    """
+    return normalize_batch(torch.stack([resize_frame(f, size) for f in frames]), order)
+
+
+class InferenceStage:
+    """Micro-batching ResNet50 embedder fed by the capture loop.
+
+    submit() only copies the frame (the capture's ring slot is reused right
+    after); a resize thread of the stage reduces it to 224x224 uint8, off the
+    capture thread, and normalization runs per batch.
+
+    submit() never blocks: a frame still waiting for the resize thread is
+    replaced by the newer one, and when the queue is full the oldest pending
+    frame is dropped, so the stage always works on the most recent frames. A batch is
+    run once it has ``batch_size`` frames or its first frame has waited
+    ``max_latency`` seconds. Each result is published on ``bus`` as
+    (frame_seqs, embeddings[N, 2048] float32, batch_ms).
+    """
+
+    def __init__(self, get_model, device, bus, batch_size=8, max_latency=0.1,
+                 queue_size=16, threads=DEFAULT_THREADS):
+        self.get_model = get_model
+        self.device = device
+        self.bus = bus
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.threads = threads
+        self.stats = {"batches": 0, "frames": 0, "dropped": 0, "last_batch_ms": 0.0, "avg_batch_ms": 0.0}
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._active = False
+        self._thread = None
+        self._resizer = None
+        self._pending = None  # (seq, full-size copy) waiting for the resize thread
+        self._spare = None  # buffer the resize thread is done with, reused by the next submit
+        self._pending_cond = threading.Condition()
+
+    def start(self):
+        self._active = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._resizer = threading.Thread(target=self._resize_loop, daemon=True)
+        self._resizer.start()
+        return self
+
+    def stop(self):
+        self._active = False
+        with self._pending_cond:
+            self._pending_cond.notify()
+        for thread in (self._resizer, self._thread):
+            if thread:
+                thread.join(timeout=5.0)
+
+    def submit(self, seq, frame):
+        """Hand a frame to the stage: one copy into a reused buffer, so the ring slot can be reused right away."""
+        src = _as_array(frame)
+        with self._pending_cond:
+            if self._pending is not None:
+                # The resize thread hasn't taken the previous frame yet: take it back and reuse its buffer
+                buf, self._pending = self._pending[1], None
+                self.stats["dropped"] += 1
+            else:
+                buf, self._spare = self._spare, None
+        if buf is None or buf.shape != src.shape:
+            buf = np.empty_like(src)
+        np.copyto(buf, src)
+        with self._pending_cond:
+            self._pending = (seq, buf)
+            self._pending_cond.notify()
+
+    def _resize_loop(self):
+        # Resizing uses the stage's torch threads (set in _run), not the capture thread
+        while self._active:
+            with self._pending_cond:
+                self._pending_cond.wait_for(lambda: self._pending is not None or not self._active, timeout=0.5)
+                item, self._pending = self._pending, None
+            if item is None:
+                continue
+            seq, full = item
+            small = resize_frame(full)
+            with self._pending_cond:
+                self._spare = full
+            self._enqueue(seq, small)
+
+    def _enqueue(self, seq, small):
+        while True:
+            try:
+                self._queue.put_nowait((seq, small))
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.stats["dropped"] += 1
+                except queue.Empty:
+                    pass
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        # Intra-op threads are process wide; keep them below the core count so capture keeps a core
+        torch.set_num_threads(self.threads)
+        model = self.get_model()
+        while self._active:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            start = time.perf_counter()
+            tensors = normalize_batch(torch.stack([small for _, small in batch])).to(self.device)
+            with torch.inference_mode():
+                embeddings = model(tensors).flatten(1).float().cpu().numpy()
+            batch_ms = (time.perf_counter() - start) * 1000
+            metrics.inference_seconds.labels("live").observe(batch_ms / 1000)
+            self.bus.publish(([seq for seq, _ in batch], embeddings, batch_ms))
+
+            stats = self.stats
+            stats["batches"] += 1
+            stats["frames"] += len(batch)
+            stats["last_batch_ms"] = batch_ms
+            stats["avg_batch_ms"] += (batch_ms - stats["avg_batch_ms"]) / stats["batches"]
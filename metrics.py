@@ -0,0 +1,279 @@
+"""
+Frame-pipeline metrics
+Counters, gauges and fixed-bucket histograms kept in one process-wide
+registry; /metrics renders them in the Prometheus text format and as JSON
+(with bucket-estimated percentiles), so grab, convert, encode, lock-wait,
+viewer and inference latencies can be scraped and alerted on
+"""
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers sub-millisecond lock waits up to multi-second model batches
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Bytes a viewer received over its whole connection
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(12))  # 1 KiB .. 4 GiB
+
+
+def _label_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """A metric family; with label names, values live in per-label children from labels()."""
+
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()  # exported as 0 before the first update
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {key}")
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+            return child
+
+    def _default(self):
+        # The unlabelled metric is its own single child
+        return self.labels()
+
+    def _items(self):
+        with self._lock:
+            return sorted(self._children.items())
+
+
+class _Value:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value  # a single store, no lock needed
+
+
+class Counter(_Metric):
+    kind = "counter"
+    _new_child = _Value
+
+    def inc(self, amount=1.0):
+        self._default().inc(amount)
+
+    def samples(self):
+        for key, child in self._items():
+            yield self.name, _label_text(self.labelnames, key), child.value
+
+    def to_json(self):
+        return {"/".join(key) or "value": child.value for key, child in self._items()}
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1.0):
+        self._default().dec(amount)
+
+    def set(self, value):
+        self._default().set(value)
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+    def quantile(self, q, counts, count):
+        """Linear interpolation inside the bucket holding the q-th observation, as histogram_quantile does."""
+        if count == 0:
+            return None
+        rank = q * count
+        seen = 0
+        for i, n in enumerate(counts):
+            if seen + n >= rank and n:
+                if i == len(self.buckets):
+                    return self.buckets[-1]  # beyond the largest bound: report that bound
+                low = self.buckets[i - 1] if i else 0.0
+                return low + (self.buckets[i] - low) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def samples(self):
+        for key, child in self._items():
+            counts, total, count = child.snapshot()
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                yield self.name + "_bucket", _label_text(self.labelnames, key, [("le", _number(bound))]), cumulative
+            labels = _label_text(self.labelnames, key)
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, count
+
+    def to_json(self):
+        out = {}
+        for key, child in self._items():
+            counts, total, count = child.snapshot()
+            out["/".join(key) or "value"] = {
+                "count": count,
+                "sum": total,
+                "mean": total / count if count else None,
+                "p50": child.quantile(0.5, counts, count),
+                "p95": child.quantile(0.95, counts, count),
+                "p99": child.quantile(0.99, counts, count),
+            }
+        return out
+
+
+class Registry:
+    """Named metric families; asking for an existing name returns the registered one."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, labelnames, **kwargs)
+            elif type(metric) is not cls:
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        # Text format 0.0.4: a counter's TYPE line names its sample, which ends in _total
+        if not name.endswith("_total"):
+            raise ValueError(f"Counter name {name} must end in _total")
+        return self._get(Counter, name, help_text, labelnames)
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._get(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def _sorted(self):
+        with self._lock:
+            return [self._metrics[name] for name in sorted(self._metrics)]
+
+    def render_prometheus(self):
+        lines = []
+        for metric in self._sorted():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        return {metric.name: {"type": metric.kind, "help": metric.help, "values": metric.to_json()}
+                for metric in self._sorted()}
+
+
+REGISTRY = Registry()
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Frame pipeline, in the order a frame goes through it
+grab_seconds = REGISTRY.histogram("capture_grab_seconds", "Time for one mss grab")
+convert_seconds = REGISTRY.histogram("capture_convert_seconds", "Raw grab copied into the frame ring and converted for encoding")
+encode_seconds = REGISTRY.histogram("jpeg_encode_seconds", "Time for one JPEG encode")
+lock_wait_seconds = REGISTRY.histogram("frame_bus_lock_wait_seconds", "Time a publisher waited for a frame bus lock")
+frames_total = REGISTRY.counter("capture_frames_total", "Frames grabbed by the main capture")
+frames_changed_total = REGISTRY.counter("capture_frames_changed_total", "Grabbed frames that differed from the previous one")
+capture_fps = REGISTRY.gauge("capture_fps", "Main capture frame rate over the last window")
+frames_dropped = REGISTRY.gauge("capture_frames_dropped", "Frame deadlines the capture pacer skipped")
+
+# Viewers
+bytes_sent_total = REGISTRY.counter("stream_bytes_sent_total", "Bytes written to stream viewers", ("stream",))
+viewer_bytes = REGISTRY.histogram("stream_viewer_bytes", "Bytes one viewer received over its connection",
+                                  ("stream",), buckets=BYTES_BUCKETS)
+active_viewers = REGISTRY.gauge("stream_active_viewers", "Connected stream viewers", ("stream",))
+
+# Model
+inference_seconds = REGISTRY.histogram("model_inference_seconds", "Time for one embedding batch", ("stage",))
+
+
+def metered(chunks, stream):
+    """Pass a streaming response's chunks through, counting the viewer and the bytes it was sent."""
+    sent = 0
+    counter = bytes_sent_total.labels(stream)
+    viewers = active_viewers.labels(stream)
+    viewers.inc()
+    try:
+        for chunk in chunks:
+            yield chunk
+            # Counted once the server asks for the next chunk, i.e. after this one was written
+            sent += len(chunk)
+            counter.inc(len(chunk))
+    finally:
+        viewers.dec()
+        viewer_bytes.labels(stream).observe(sent)
+        chunks.close()
@@ -3,11 +3,11 @@ Simple Flask web app for interactive screenshot and drag-to-select region
 Runs on port 5000 as a separate web service
 """
 
-from flask import Flask, render_template_string, request, send_file
-from PIL import Image
+from flask import Flask, render_template_string, request, send_file, Response
 import mss
-import io
-import base64
+import numpy as np
+import snapshot
+from capture_backend import SharedFrameRing
 
 app = Flask(__name__)
 
@@ -280,20 +280,26 @@ HTML_TEMPLATE = """
             }, 3000);
         }
         
+        let screenshotUrl = null;
+        
         function captureScreenshot() {
             fetch('/screenshot')
-                .then(response => response.json())
-                .then(data => {
-                    if (data.error) {
+                .then(async response => {
+                    if (!response.ok) {
+                        const data = await response.json();
                         showStatus('Error: ' + data.error, 'error');
                         return;
                     }
+                    const blob = await response.blob();
                     
                     img = document.getElementById('screenshot');
                     canvas = document.getElementById('canvas');
                     ctx = canvas.getContext('2d');
                     
-                    img.src = 'data:image/png;base64,' + data.screenshot;
+                    // Binary image straight from the server; free the previous one
+                    if (screenshotUrl) URL.revokeObjectURL(screenshotUrl);
+                    screenshotUrl = URL.createObjectURL(blob);
+                    img.src = screenshotUrl;
                     
                     img.onload = () => {
                         canvas.width = img.naturalWidth;
@@ -430,25 +436,42 @@ HTML_TEMPLATE = """
 def index():
     return render_template_string(HTML_TEMPLATE)
 
+def live_monitor_frame():
+    # (bgra, size, capture source) of the primary monitor cut from app.py's live capture (shared
+    # memory, SHARED_CAPTURE=1), or None if the capture isn't running, isn't shared or doesn't
+    # cover the whole monitor
+    latest = SharedFrameRing.read_latest()
+    if latest is None or latest[0]['screen'] is None:
+        return None
+    info, data = latest
+    monitor = info['screen']
+    x0, y0 = monitor['left'] - info['left'], monitor['top'] - info['top']
+    x1, y1 = x0 + monitor['width'], y0 + monitor['height']
+    if x0 < 0 or y0 < 0 or x1 > info['width'] or y1 > info['height']:
+        return None
+    frame = np.frombuffer(data, dtype=np.uint8).reshape(info['height'], info['width'], 4)
+    return np.ascontiguousarray(frame[y0:y1, x0:x1]).tobytes(), (monitor['width'], monitor['height']), info['source']
+
 @app.route('/screenshot', methods=['GET'])
 def get_screenshot():
+    # Binary image: ?format=jpeg|webp|png&level=; size in X-Image-Width/Height, 304 when If-None-Match is current
     try:
-        with mss.mss() as sct:
-            monitor = sct.monitors[1]
-            screenshot = sct.grab(monitor)
-            img = Image.frombytes('RGB', screenshot.size, screenshot.rgb)
-            
-            # Convert to base64
-            buffer = io.BytesIO()
-            img.save(buffer, format='PNG')
-            buffer.seek(0)
-            b64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-            
-            return {
-                'screenshot': b64,
-                'width': screenshot.size[0],
-                'height': screenshot.size[1]
-            }
+        fmt, level = snapshot.parse_options(request.args)
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    try:
+        live = live_monitor_frame()
+        if live is not None:
+            (bgra, size, capture_source), source = live, 'live'
+        else:
+            # No shared capture to cut from; only now is a display connection worth opening
+            with mss.mss() as sct:
+                screenshot = sct.grab(sct.monitors[1])
+            bgra, size, capture_source, source = screenshot.bgra, screenshot.size, 'mss', 'grab'
+        status, body, headers = snapshot.render(bgra, size, fmt, level, request.headers.get('If-None-Match'))
+        headers['X-Frame-Source'] = source
+        headers['X-Capture-Source'] = capture_source
+        return Response(body, status=status, headers=headers)
     except Exception as e:
         return {'error': str(e)}, 500
 
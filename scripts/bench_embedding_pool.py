@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Tile embedding throughput: in-process model vs EmbeddingPool at 1..N worker processes"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+
+import backbone
+from embedding_pool import EmbeddingPool
+from tile_index import embed_images
+
+
+def worker_counts(cores):
+    counts, n = [], 1
+    while n <= cores:
+        counts.append(n)
+        n *= 2
+    if counts[-1] != cores:
+        counts.append(cores)
+    return counts
+
+
+def throughput(embed, tiles, repeats):
+    embed(tiles[:8])  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        embed(tiles)
+    return len(tiles) * repeats / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tiles", type=int, default=128)
+    parser.add_argument("--size", type=int, default=256, help="tile side in pixels")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--workers", help="comma-separated worker counts (default: 1, 2, 4, ... up to the core count)")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    counts = [int(c) for c in args.workers.split(",")] if args.workers else worker_counts(cores)
+    tiles = backbone.synthetic_images(args.tiles, size=args.size)
+
+    model = backbone.load_backbone()
+    baseline = throughput(lambda batch: embed_images(model, batch, torch.device("cpu")), tiles, args.repeats)
+    del model
+    rows = [{"workers": 0, "threads_per_worker": torch.get_num_threads(), "tiles_per_s": baseline, "startup_s": 0.0}]
+
+    for workers in counts:
+        t0 = time.perf_counter()
+        pool = EmbeddingPool(workers=workers)
+        startup = time.perf_counter() - t0
+        try:
+            rate = throughput(pool.embed, tiles, args.repeats)
+        finally:
+            pool.close()
+        rows.append({"workers": workers, "threads_per_worker": pool.threads_per_worker,
+                     "tiles_per_s": rate, "startup_s": startup})
+
+    print(f"Embedding {args.tiles} {args.size}x{args.size} tiles x {args.repeats}, {cores} cores, MODEL_MODE={backbone.MODEL_MODE}")
+    print("=" * 70)
+    print(f"{'workers':>9} | {'threads/worker':>14} | {'tiles/s':>8} | {'speedup':>7} | {'startup':>8}")
+    for r in rows:
+        name = "in-proc" if r["workers"] == 0 else str(r["workers"])
+        print(f"{name:>9} | {r['threads_per_worker']:>14} | {r['tiles_per_s']:8.1f} | "
+              f"{r['tiles_per_s'] / baseline:6.2f}x | {r['startup_s']:7.1f}s")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"cores": cores, "tiles": args.tiles, "size": args.size, "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""Per-frame grab latency: new mss context per frame vs one persistent MssGrabber"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mss
+from capture_backend import MssGrabber
+
+
+def grab_per_frame(region):
+    # What capture_desktop_screenshot used to do for every frame
+    with mss.mss() as sct:
+        monitor = sct.monitors[0]
+        if region:
+            x, y, w, h = region
+            monitor = {"top": y, "left": x, "width": w, "height": h}
+        return sct.grab(monitor)
+
+
+def measure(fn, frames):
+    timings = []
+    for _ in range(frames):
+        t0 = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - t0) * 1000)
+    return timings
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{name:<12} mean {statistics.mean(timings):7.2f} ms | "
+          f"p50 {statistics.median(timings):7.2f} ms | p95 {p95:7.2f} ms | "
+          f"max {timings[-1]:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--region", help="x,y,w,h (default: full desktop)")
+    args = parser.parse_args()
+    region = tuple(int(v) for v in args.region.split(",")) if args.region else None
+
+    print(f"Grab latency over {args.frames} frames, region={region or 'full desktop'}")
+    print("=" * 70)
+    report("per-frame", measure(lambda: grab_per_frame(region), args.frames))
+    with MssGrabber() as grabber:
+        grabber.grab(region)  # warm-up, mirrors the capture thread's first frame
+        report("persistent", measure(lambda: grabber.grab(region), args.frames))
+
+
+if __name__ == "__main__":
+    main()
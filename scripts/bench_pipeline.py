@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""Headless capture + streaming benchmark: fps, encode cost, memory and bytes/frame per pattern and stream mode"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODES = ("none", "mjpeg", "mjpeg_960", "tiles", "h264")
+# Compared with --compare; the sign says which direction is a regression
+KEY_METRICS = (("capture_fps", 1), ("encode_ms", -1), ("bytes_per_frame", -1), ("cpu_pct", -1), ("rss_mb", -1))
+COMPARE_THRESHOLD = 0.10
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)  # peak only, where VmRSS is missing
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class HistogramDelta:
+    """Observations a histogram received between construction and read()."""
+
+    def __init__(self, histogram):
+        self.child = histogram.labels()
+        self.counts, self.sum, self.count = self.child.snapshot()
+
+    def read(self):
+        counts, total, count = self.child.snapshot()
+        counts = [a - b for a, b in zip(counts, self.counts)]
+        count -= self.count
+        mean = (total - self.sum) / count * 1000 if count else 0.0
+        p95 = self.child.quantile(0.95, counts, count)
+        return count, mean, (p95 or 0.0) * 1000
+
+
+def open_viewer(desktop, mode):
+    """The generator a viewer of ``mode`` would be streamed, or None for a capture-only run."""
+    if mode == "mjpeg":
+        return desktop.generate_video_stream()
+    if mode == "mjpeg_960":
+        return desktop.generate_video_stream(960, 60)
+    if mode == "tiles":
+        return desktop.generate_tile_stream()
+    if mode == "h264":
+        encoder = desktop.get_video_encoder()
+        if encoder is None or not encoder.wait_ready():
+            raise RuntimeError("H.264 encoder did not start")
+        return encoder.stream()
+    return None
+
+
+def consume(chunks, stop, received):
+    # Stands in for the server's socket writes; a yielded chunk counts as sent
+    try:
+        for chunk in chunks:
+            received["bytes"] += len(chunk)
+            received["parts"] += 1
+            if stop.is_set():
+                break
+    finally:
+        chunks.close()
+
+
+def run(desktop, metrics, pattern, mode, args):
+    desktop.CAPTURE_SOURCE = f"synthetic:{pattern}"
+    status = desktop.start_desktop_capture({"fps": args.fps})
+    if not status["status"].startswith("✅"):
+        raise RuntimeError(status["status"])
+    try:
+        time.sleep(args.warmup)
+        stop = threading.Event()
+        received = {"bytes": 0, "parts": 0}
+        viewer = None
+        chunks = open_viewer(desktop, mode)
+        if chunks is not None:
+            viewer = threading.Thread(target=consume, args=(chunks, stop, received), daemon=True)
+
+        frames = metrics.frames_total.labels()
+        changed = metrics.frames_changed_total.labels()
+        frames_before, changed_before = frames.value, changed.value
+        grab, convert, encode = (HistogramDelta(h) for h in (metrics.grab_seconds, metrics.convert_seconds, metrics.encode_seconds))
+        cpu_start, start = time.process_time(), time.perf_counter()
+        if viewer:
+            viewer.start()
+        time.sleep(args.seconds)
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+        sent = dict(received)
+        captured = frames.value - frames_before
+        result = {
+            "pattern": pattern,
+            "mode": mode,
+            "seconds": elapsed,
+            "capture_fps": captured / elapsed,
+            "changed_fps": (changed.value - changed_before) / elapsed,
+            "viewer_parts_per_s": sent["parts"] / elapsed,
+            "bytes_per_s": sent["bytes"] / elapsed,
+            "bytes_per_frame": sent["bytes"] / captured if captured else 0.0,
+            "grab_ms": grab.read()[1],
+            "convert_ms": convert.read()[1],
+            "cpu_pct": cpu / elapsed * 100,
+            "rss_mb": rss_mb(),
+        }
+        result["encodes_per_s"], result["encode_ms"], result["encode_p95_ms"] = encode.read()
+        result["encodes_per_s"] /= elapsed
+        # Let the viewer see one more chunk and hang up while frames still flow, so a
+        # per-viewer variant encoder is gone before the next run starts measuring
+        stop.set()
+        if viewer:
+            viewer.join(timeout=desktop.STREAM_KEEPALIVE + 2)
+        return result
+    finally:
+        desktop.stop_desktop_capture()
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {(r["pattern"], r["mode"]): r for r in json.load(f)["results"]}
+    print()
+    print(f"Change vs {baseline_path} (! marks a regression over {COMPARE_THRESHOLD:.0%})")
+    print("=" * 90)
+    print(f"{'pattern':<8} | {'mode':<9} | " + " | ".join(f"{name:>15}" for name, _ in KEY_METRICS))
+    for r in results:
+        old = baseline.get((r["pattern"], r["mode"]))
+        if old is None:
+            continue
+        cells = []
+        for name, better in KEY_METRICS:
+            if not old.get(name):
+                cells.append(f"{'n/a':>15}")
+                continue
+            change = (r[name] - old[name]) / old[name]
+            flag = "!" if change * better < -COMPARE_THRESHOLD else " "
+            cells.append(f"{change:+14.1%}{flag}")
+        print(f"{r['pattern']:<8} | {r['mode']:<9} | " + " | ".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--patterns", default="moving,static,noise", help="comma-separated synthetic patterns")
+    parser.add_argument("--modes", default=",".join(MODES), help=f"comma-separated stream modes ({', '.join(MODES)})")
+    parser.add_argument("--size", default="1920x1080", help="synthetic desktop size WxH")
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--seconds", type=float, default=5.0, help="measured time per run")
+    parser.add_argument("--warmup", type=float, default=1.0)
+    parser.add_argument("--json", help="write machine-readable results to this file")
+    parser.add_argument("--compare", help="results file from an earlier run to diff against")
+    args = parser.parse_args()
+
+    # Read when capture_backend is imported; no display is touched with a synthetic source
+    os.environ["SYNTHETIC_SIZE"] = args.size
+    os.environ["CAPTURE_SOURCE"] = "synthetic"
+    import app as desktop
+    import metrics
+    import stream_codec
+
+    patterns = args.patterns.split(",")
+    modes = args.modes.split(",")
+    if "h264" in modes and not stream_codec.ffmpeg_available():
+        print("[WARN] ffmpeg not installed, skipping h264")
+        modes.remove("h264")
+
+    results = []
+    for pattern in patterns:
+        for mode in modes:
+            results.append(run(desktop, metrics, pattern, mode, args))
+
+    print(f"Pipeline at {args.size}, target {args.fps:.0f} fps, {args.seconds:.0f} s per run")
+    print("=" * 110)
+    print(f"{'pattern':<8} | {'mode':<9} | {'fps':>5} | {'changed':>7} | {'encode ms':>9} | {'p95':>6} | "
+          f"{'enc/s':>5} | {'KB/frame':>8} | {'KB/s':>7} | {'cpu %':>5} | {'RSS MB':>6}")
+    for r in results:
+        print(f"{r['pattern']:<8} | {r['mode']:<9} | {r['capture_fps']:5.1f} | {r['changed_fps']:7.1f} | "
+              f"{r['encode_ms']:9.2f} | {r['encode_p95_ms']:6.1f} | {r['encodes_per_s']:5.1f} | "
+              f"{r['bytes_per_frame'] / 1024:8.1f} | {r['bytes_per_s'] / 1024:7.0f} | {r['cpu_pct']:5.0f} | {r['rss_mb']:6.0f}")
+
+    if args.json:
+        meta = {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "size": args.size,
+            "fps": args.fps,
+            "seconds": args.seconds,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        }
+        with open(args.json, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""app.preprocess (PIL + torchvision transforms) vs inference.preprocess_frames on raw BGRA frames"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import torch
+from PIL import Image
+
+from app import preprocess
+from inference import preprocess_frames
+
+
+def pil_path(frames):
+    # What a captured frame goes through today: BGRA -> PIL RGB -> Resize -> ToTensor -> Normalize
+    images = [Image.frombuffer("RGB", (f.shape[1], f.shape[0]), f, "raw", "BGRX", 0, 1) for f in frames]
+    return torch.stack([preprocess(img) for img in images])
+
+
+def timed(fn, frames, repeats):
+    timings = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        out = fn(frames)
+        timings.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(timings), out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=torch.get_num_threads())
+    args = parser.parse_args()
+    torch.set_num_threads(args.threads)
+
+    rng = np.random.default_rng(0)
+    # Smooth gradient plus noise, so resize behaviour resembles a real desktop more than pure noise
+    base = np.linspace(0, 255, args.width, dtype=np.float32)[None, :, None]
+    print(f"Preprocess {args.width}x{args.height} BGRA frames, {args.threads} threads, median of {args.repeats}")
+    print("=" * 72)
+    print(f"{'batch':>5} | {'PIL path':>10} | {'tensor path':>11} | {'speedup':>7} | {'max |diff|':>10}")
+    for batch in (1, 2, 4, 8, 16, 32):
+        frames = [
+            np.clip(base + rng.normal(0, 20, (args.height, args.width, 4)), 0, 255).astype(np.uint8)
+            for _ in range(batch)
+        ]
+        old_ms, old = timed(pil_path, frames, args.repeats)
+        new_ms, new = timed(preprocess_frames, frames, args.repeats)
+        diff = (old - new).abs().max().item()
+        print(f"{batch:>5} | {old_ms:8.1f}ms | {new_ms:9.1f}ms | {old_ms / new_ms:6.1f}x | {diff:10.4f}")
+
+
+if __name__ == "__main__":
+    main()
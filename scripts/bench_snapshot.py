@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Screenshot endpoint cost: old base64 PNG-in-JSON vs binary WebP/JPEG/PNG and the 304 path"""
+
+import argparse
+import base64
+import json
+import os
+import statistics
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+import snapshot
+
+
+def desktop_frame(width, height, live):
+    """Raw BGRA bytes: a real grab with --live, else windows, text-like noise and a gradient."""
+    if live:
+        import mss
+        with mss.mss() as sct:
+            shot = sct.grab(sct.monitors[1])
+        return shot.bgra, shot.size
+    rng = np.random.default_rng(0)
+    frame = np.full((height, width, 4), 235, dtype=np.uint8)
+    frame[..., :3] = np.linspace(180, 250, width, dtype=np.uint8)[None, :, None]
+    for _ in range(12):
+        x, y = rng.integers(0, width - 400), rng.integers(0, height - 300)
+        w, h = rng.integers(200, 400), rng.integers(150, 300)
+        frame[y:y + h, x:x + w, :3] = rng.integers(200, 255, 3)
+        text = rng.random((h - 40, w - 20)) < 0.15
+        frame[y + 30:y + h - 10, x + 10:x + w - 10, :3][text] = 30
+    return frame.tobytes(), (width, height)
+
+
+def old_path(bgra, size):
+    # What /get_screenshot did: PNG with optimize=True, base64, JSON
+    img = Image.frombytes("RGB", size, bgra, "raw", "BGRX")
+    buf = BytesIO()
+    img.save(buf, format="PNG", optimize=True)
+    return json.dumps({"b64": base64.b64encode(buf.getvalue()).decode("ascii")}).encode()
+
+
+def timed(fn, repeats):
+    timings = []
+    out = None
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        out = fn()
+        timings.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(timings), out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--live", action="store_true", help="use a real screen grab instead of a synthetic desktop")
+    args = parser.parse_args()
+
+    bgra, size = desktop_frame(args.width, args.height, args.live)
+    print(f"Screenshot of {size[0]}x{size[1]}, median of {args.repeats}")
+    print("=" * 60)
+    print(f"{'variant':<22} | {'server ms':>9} | {'bytes':>10} | {'vs old':>7}")
+
+    old_ms, old_body = timed(lambda: old_path(bgra, size), args.repeats)
+    print(f"{'PNG optimize+base64':<22} | {old_ms:9.1f} | {len(old_body):>10} | {'1.00x':>7}")
+    for fmt, (_, _, default, _) in snapshot.FORMATS.items():
+        for level in sorted({default, {"png": 6, "jpeg": 70, "webp": 60}[fmt]}):
+            def run():
+                snapshot._last.update(etag=None, body=None)  # measure the encode, not the reuse
+                return snapshot.render(bgra, size, fmt, level)[1]
+            ms, body = timed(run, args.repeats)
+            print(f"{f'{fmt} level {level}':<22} | {ms:9.1f} | {len(body):>10} | {old_ms / ms:6.1f}x")
+
+    _, _, headers = snapshot.render(bgra, size, "jpeg", 85)
+    ms, _ = timed(lambda: snapshot.render(bgra, size, "jpeg", 85, headers["ETag"]), args.repeats)
+    print(f"{'304 (unchanged)':<22} | {ms:9.1f} | {0:>10} | {old_ms / ms:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
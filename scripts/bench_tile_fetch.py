@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Tile download throughput/latency: per-call requests.get from 8 threads vs TileFetcher, against the local stand-in"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import requests
+
+from tile_fetcher import TileFetcher, neighbour_ring
+from tile_server import serve
+
+
+def workload(grid, repeats):
+    # A grid search's tiles, requested `repeats` times concurrently (augmentations asking for the same tile)
+    tiles = [(18, 1000 + dx, 2000 + dy) for dy in range(grid) for dx in range(grid)]
+    return tiles * repeats
+
+
+def run(fetch_one, tiles, workers):
+    latencies = []
+
+    def timed(tile):
+        t0 = time.perf_counter()
+        fetch_one(*tile)
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(timed, tiles))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "tiles_per_s": len(tiles) / elapsed,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))],
+        "elapsed_s": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--grid", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    tiles = workload(args.grid, args.repeats)
+    print(f"{len(tiles)} requests ({args.grid}x{args.grid} grid x {args.repeats}), "
+          f"{args.latency * 1000:.0f} ms server latency, {args.error_rate:.0%} errors, {args.workers} workers")
+    print("=" * 92)
+    print(f"{'client':<14} | {'tiles/s':>8} | {'p50':>8} | {'p95':>8} | {'HTTP requests':>13} | {'connections':>11} | {'failed':>6}")
+
+    server = serve(latency=args.latency, error_rate=args.error_rate)
+
+    failures = 0
+
+    def naive(z, x, y):
+        nonlocal failures
+        # What the documented downloader does: a fresh connection per call, no retry
+        resp = requests.get(server.url.format(z=z, x=x, y=y), timeout=3)
+        if resp.status_code != 200:
+            failures += 1
+
+    result = run(naive, tiles, args.workers)
+    report("requests.get", result, server.stats, failures)
+
+    server.stats.update(requests=0, connections=0, errors=0)
+    fetcher = TileFetcher(server.url, max_concurrency=args.workers)
+    failures = 0
+
+    def pooled(z, x, y):
+        nonlocal failures
+        try:
+            fetcher(z, x, y)
+        except Exception:
+            failures += 1
+
+    result = run(pooled, tiles, args.workers * 2)
+    report("TileFetcher", result, server.stats, failures)
+
+    server.stats.update(requests=0, connections=0, errors=0)
+    t0 = time.perf_counter()
+    fetcher.fetch_many(neighbour_ring(sorted(set(tiles))))
+    print(f"\nneighbour ring prefetch: {server.stats['requests']} requests in {time.perf_counter() - t0:.2f}s")
+    print(f"TileFetcher counters: {fetcher.stats}")
+    fetcher.close()
+    server.shutdown()
+
+
+def report(name, result, server_stats, failures):
+    print(f"{name:<14} | {result['tiles_per_s']:8.1f} | {result['p50_ms']:6.1f}ms | {result['p95_ms']:6.1f}ms | "
+          f"{server_stats['requests']:>13} | {server_stats['connections']:>11} | {failures:>6}")
+
+
+if __name__ == "__main__":
+    main()
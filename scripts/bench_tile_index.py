@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Tile matching: per-tile cosine loop vs the embedding index (exact and IVF), on synthetic embeddings"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from tile_index import EmbeddingIndex
+
+
+def synthetic_embeddings(n, dim, clusters, rng):
+    # Clustered, non-negative like pooled ResNet features, so IVF sees realistic structure
+    centres = np.abs(rng.normal(0, 1, (clusters, dim))).astype(np.float32)
+    return centres[rng.integers(0, clusters, n)] + np.abs(rng.normal(0, 0.5, (n, dim))).astype(np.float32)
+
+
+def per_tile_loop(embeddings, query, k):
+    # What the grid search does today: one cosine per tile, then sort
+    scores = []
+    for i, emb in enumerate(embeddings):
+        scores.append((float(np.dot(emb, query) / (np.linalg.norm(emb) * np.linalg.norm(query))), i))
+    return sorted(scores, reverse=True)[:k]
+
+
+def timed(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        out = fn()
+        timings.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(timings), out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="25,1000,100000")
+    parser.add_argument("--dim", type=int, default=2048)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--nprobe", type=int, default=8)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"Top-{args.k} cosine search, {args.dim}-d embeddings, median over {args.queries} queries")
+    print("=" * 86)
+    print(f"{'tiles':>7} | {'loop':>9} | {'exact f16':>9} | {'IVF f16':>9} | {'IVF recall':>10} | {'build IVF':>9} | {'load':>7}")
+    for n in (int(s) for s in args.sizes.split(",")):
+        embeddings = synthetic_embeddings(n, args.dim, max(4, n // 50), rng)
+        coords = np.stack([np.full(n, 18), np.arange(n) % 1000, np.arange(n) // 1000], axis=1)
+        queries = embeddings[rng.integers(0, n, args.queries)] + rng.normal(0, 0.2, (args.queries, args.dim))
+
+        loop_ms = statistics.median(
+            timed(lambda: per_tile_loop(embeddings, q, args.k), 1)[0] for q in queries[:3]) if n <= 10000 else float("nan")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            EmbeddingIndex.build(embeddings, coords, ivf=False).save(os.path.join(tmp, "exact"))
+            t0 = time.perf_counter()
+            EmbeddingIndex.build(embeddings, coords, ivf=True).save(os.path.join(tmp, "ivf"))
+            build_s = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            exact = EmbeddingIndex.load(os.path.join(tmp, "exact"))
+            load_ms = (time.perf_counter() - t0) * 1000
+            ivf = EmbeddingIndex.load(os.path.join(tmp, "ivf"))
+
+            exact_ms = statistics.median(timed(lambda: exact.search(q, args.k), 3)[0] for q in queries)
+            ivf_ms = statistics.median(timed(lambda: ivf.search(q, args.k, args.nprobe), 3)[0] for q in queries)
+            recall = statistics.mean(
+                len({tuple(c) for c in exact.search(q, args.k)[1]} & {tuple(c) for c in ivf.search(q, args.k, args.nprobe)[1]}) / args.k
+                for q in queries)
+        print(f"{n:>7} | {loop_ms:7.2f}ms | {exact_ms:7.2f}ms | {ivf_ms:7.2f}ms | {recall:10.0%} | {build_s:8.2f}s | {load_ms:5.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
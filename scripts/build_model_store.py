@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Populate the local model store and measure cold model-ready time (load + warm-up batch) from it"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+READY_PROBE = """
+import time
+t0 = time.perf_counter()
+import torch
+import backbone
+t1 = time.perf_counter()
+model = backbone.load_backbone('fp32')
+t2 = time.perf_counter()
+with torch.inference_mode():
+    model(torch.zeros(8, 3, 224, 224))
+t3 = time.perf_counter()
+print(f"RESULT {t1 - t0:.4f} {t2 - t1:.4f} {t3 - t2:.4f}")
+"""
+
+
+def measure_ready():
+    out = subprocess.run([sys.executable, "-c", READY_PROBE], cwd=ROOT, capture_output=True, text=True)
+    for line in out.stdout.splitlines():
+        if line.startswith("RESULT"):
+            return [float(v) for v in line.split()[1:]]
+    raise RuntimeError(f"probe failed:\n{out.stderr[-2000:]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--weights", help="local torchvision resnet50 checkpoint (default: RESNET50_WEIGHTS or torchvision's cache)")
+    parser.add_argument("--rebuild", action="store_true", help="overwrite an existing store")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    import backbone
+
+    if args.rebuild or not os.path.exists(backbone.STORE_PATH):
+        from torchvision.models import resnet50
+        t0 = time.perf_counter()
+        model = resnet50(weights=None)
+        model.load_state_dict(backbone.imagenet_state_dict(args.weights or backbone.WEIGHTS_FILE))
+        backbone.save_store(backbone._truncate(model).eval())
+        print(f"Wrote {backbone.STORE_PATH} in {time.perf_counter() - t0:.2f}s")
+    size_mb = os.path.getsize(backbone.STORE_PATH) / 1e6
+    print(f"Model store: {backbone.STORE_PATH} ({size_mb:.1f} MB)")
+
+    # Every run is a fresh process: nothing torch-side is warm, only the OS page cache
+    runs = [measure_ready() for _ in range(args.runs)]
+    imports, loads, warmups = zip(*runs)
+    ready = [l + w for l, w in zip(loads, warmups)]
+    print(f"Cold model-ready ({args.runs} runs, fresh process each)")
+    print("=" * 50)
+    print(f"import torch:        median {statistics.median(imports):.2f}s")
+    print(f"load from store:     median {statistics.median(loads):.3f}s")
+    print(f"warm-up batch (8):   median {statistics.median(warmups):.3f}s")
+    print(f"model ready:         median {statistics.median(ready):.3f}s  (min {min(ready):.3f}s)")
+
+
+if __name__ == "__main__":
+    main()
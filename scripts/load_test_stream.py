@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Open N concurrent /video_stream clients and report per-client fps and server CPU"""
+
+import argparse
+import statistics
+import threading
+import time
+
+import requests
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+BOUNDARY = b"--frame"
+
+
+def stream_client(url, duration, results, index):
+    frames = 0
+    received = 0
+    status = None
+    deadline = time.time() + duration
+    try:
+        with requests.get(url, stream=True, timeout=(5, 10)) as resp:
+            status = resp.status_code
+            if resp.ok:
+                tail = b""
+                for chunk in resp.iter_content(chunk_size=64 * 1024):
+                    received += len(chunk)
+                    # Keep a short tail so a boundary split across chunks still counts once
+                    data = tail + chunk
+                    frames += data.count(BOUNDARY)
+                    tail = data[-(len(BOUNDARY) - 1):]
+                    if time.time() >= deadline:
+                        break
+    except requests.RequestException as e:
+        status = f"error: {type(e).__name__}"
+    # The first boundary opens the stream, it isn't a frame
+    results[index] = {"status": status, "frames": max(0, frames - 1), "bytes": received}
+
+
+def sample_cpu(pid, duration, samples):
+    proc = psutil.Process(pid)
+    proc.cpu_percent(None)
+    end = time.time() + duration
+    while time.time() < end:
+        time.sleep(1.0)
+        samples.append(proc.cpu_percent(None))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--clients", type=int, default=5)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--query", default="", help="extra query string, e.g. max_width=640&quality=60")
+    parser.add_argument("--pid", type=int, help="server process id to sample CPU from (needs psutil)")
+    parser.add_argument("--start-capture", action="store_true", help="POST /start_capture before the test")
+    args = parser.parse_args()
+
+    base = args.url.rstrip("/")
+    if args.start_capture:
+        print(requests.post(f"{base}/start_capture", json={}, timeout=5).json())
+        time.sleep(2.0)
+
+    stream_url = f"{base}/video_stream" + (f"?{args.query}" if args.query else "")
+    results = [None] * args.clients
+    threads = [threading.Thread(target=stream_client, args=(stream_url, args.duration, results, i))
+               for i in range(args.clients)]
+    cpu_samples = []
+    cpu_thread = None
+    if args.pid and psutil:
+        cpu_thread = threading.Thread(target=sample_cpu, args=(args.pid, args.duration, cpu_samples))
+        cpu_thread.start()
+    elif args.pid:
+        print("⚠️  psutil not installed - skipping server CPU sampling")
+
+    print(f"Load test: {args.clients} clients x {args.duration:.0f}s -> {stream_url}")
+    print("=" * 60)
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if cpu_thread:
+        cpu_thread.join()
+
+    fps = []
+    for i, r in enumerate(results):
+        client_fps = r["frames"] / args.duration
+        print(f"client {i:3d}: status {r['status']} | {client_fps:5.1f} fps | {r['bytes'] / args.duration / 1e6:6.2f} MB/s")
+        if r["status"] == 200:
+            fps.append(client_fps)
+    print("=" * 60)
+    print(f"Connected: {len(fps)}/{args.clients}")
+    if fps:
+        print(f"Per-client fps: min {min(fps):.1f} | mean {statistics.mean(fps):.1f} | max {max(fps):.1f}")
+    if cpu_samples:
+        print(f"Server CPU: mean {statistics.mean(cpu_samples):.1f}% | max {max(cpu_samples):.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Accuracy/latency report: each MODEL_MODE's embeddings vs fp32 on a fixed image set"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+import torch.nn.functional as F
+
+import backbone
+from inference import preprocess_frames
+
+
+def embed(model, batch):
+    with torch.inference_mode():
+        return model(batch).flatten(1).float()
+
+
+def latency_ms(model, batch, repeats):
+    embed(model, batch)  # warm-up (oneDNN primitive creation, compile)
+    timings = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        embed(model, batch)
+        timings.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", default=backbone.CALIBRATION_DIR,
+                        help="directory of evaluation images (default: deterministic synthetic set)")
+    parser.add_argument("--count", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--modes", default=",".join(backbone.MODES))
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    # Evaluate on a different seed than int8 calibration uses, so the report isn't calibrating on its test set
+    if args.images:
+        batch = backbone.calibration_batch(args.count, args.images)
+    else:
+        batch = preprocess_frames(backbone.synthetic_images(args.count, seed=1), order="RGB")
+    # fp32 always runs first: it is the reference the other modes are compared against
+    modes = ["fp32"] + [m for m in args.modes.split(",") if m != "fp32"]
+    reference = None
+    rows = []
+    for mode in modes:
+        t0 = time.perf_counter()
+        model = backbone.load_backbone(mode)
+        load_s = time.perf_counter() - t0
+        emb = embed(model, batch)
+        if reference is None:
+            reference = emb
+        cos = F.cosine_similarity(emb, reference, dim=1)
+        # Does each image's nearest neighbour in the set stay the same as with fp32?
+        sim = F.normalize(emb, dim=1) @ F.normalize(emb, dim=1).T
+        ref_sim = F.normalize(reference, dim=1) @ F.normalize(reference, dim=1).T
+        sim.fill_diagonal_(-1)
+        ref_sim.fill_diagonal_(-1)
+        nn_agree = (sim.argmax(1) == ref_sim.argmax(1)).float().mean().item()
+        rows.append({
+            "mode": mode,
+            "load_s": load_s,
+            "latency_b1_ms": latency_ms(model, batch[:1], args.repeats),
+            "latency_b8_ms": latency_ms(model, batch[:8], args.repeats),
+            "cosine_mean": cos.mean().item(),
+            "cosine_min": cos.min().item(),
+            "max_abs_diff": (emb - reference).abs().max().item(),
+            "nn_agreement": nn_agree,
+        })
+
+    print(f"ResNet50 backbone modes on {len(batch)} images, torch {torch.__version__}, {torch.get_num_threads()} threads")
+    print()
+    print("| mode | load (s) | b1 (ms) | b8 (ms) | cos mean | cos min | max abs diff | NN agreement |")
+    print("|------|---------:|--------:|--------:|---------:|--------:|-------------:|-------------:|")
+    for r in rows:
+        print(f"| {r['mode']} | {r['load_s']:.2f} | {r['latency_b1_ms']:.1f} | {r['latency_b8_ms']:.1f} | "
+              f"{r['cosine_mean']:.4f} | {r['cosine_min']:.4f} | {r['max_abs_diff']:.4f} | {r['nn_agreement']:.0%} |")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"torch": torch.__version__, "threads": torch.get_num_threads(), "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
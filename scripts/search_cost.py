@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""Tiles embedded per search radius: full zoom-18 grid vs coarse-to-fine hierarchical search"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from hierarchical_search import covering_tiles, hierarchical_search
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lat", type=float, default=50.45)
+    parser.add_argument("--lon", type=float, default=30.52)
+    parser.add_argument("--radii-km", default="0.5,1,5,10,20,50,100")
+    parser.add_argument("--zoom", type=int, default=18)
+    parser.add_argument("--beam", type=int, default=4)
+    parser.add_argument("--tile-seconds", type=float, default=0.4,
+                        help="embedding time per tile used for the time estimate (docs: ~0.3-0.4 s balanced)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+
+    def embed_tiles(tiles):
+        # Cost only: random embeddings stand in for downloads + ResNet50
+        return tiles, rng.normal(size=(len(tiles), 64)).astype(np.float32)
+
+    print(f"Search cost at zoom {args.zoom}, beam {args.beam}, {args.tile_seconds:.2f} s/tile")
+    print("=" * 78)
+    print(f"{'radius':>8} | {'grid tiles':>10} | {'est. grid':>9} | {'hier. tiles':>11} | {'levels':>6} | {'est. hier.':>10}")
+    for radius_km in (float(r) for r in args.radii_km.split(",")):
+        radius_m = radius_km * 1000
+        grid = len(covering_tiles(args.lat, args.lon, radius_m, args.zoom))
+        result = hierarchical_search(rng.normal(size=64), args.lat, args.lon, radius_m, embed_tiles,
+                                     target_zoom=args.zoom, beam=args.beam, budget=float("inf"))
+        hier = result["tiles_scored"]
+        print(f"{radius_km:6.1f}km | {grid:>10} | {grid * args.tile_seconds:8.0f}s | {hier:>11} | "
+              f"{len(result['levels']):>6} | {hier * args.tile_seconds:9.0f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Measure app import time and time-to-first-response of / from a cold process"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_PROBE = """
+import sys, time
+t0 = time.perf_counter()
+import app
+elapsed = time.perf_counter() - t0
+heavy = [m for m in ('torch', 'torchvision', 'cv2') if m in sys.modules]
+print(f"RESULT {elapsed:.4f} {','.join(heavy) or '-'}")
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_import():
+    out = subprocess.run([sys.executable, "-c", IMPORT_PROBE], cwd=ROOT, capture_output=True, text=True)
+    for line in out.stdout.splitlines():
+        if line.startswith("RESULT"):
+            _, elapsed, heavy = line.split()
+            return float(elapsed), heavy
+    raise RuntimeError(f"import failed:\n{out.stderr[-2000:]}")
+
+
+def measure_first_response(timeout, profile):
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), SERVER_PROFILE=profile)
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "app.py"], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as resp:
+                    if resp.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.05)
+        raise RuntimeError(f"no response within {timeout}s")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--profile", default="dev", choices=["dev", "production"])
+    args = parser.parse_args()
+
+    imports, responses = [], []
+    heavy = "-"
+    for _ in range(args.runs):
+        elapsed, heavy = measure_import()
+        imports.append(elapsed)
+        responses.append(measure_first_response(args.timeout, args.profile))
+
+    print(f"Startup ({args.runs} cold runs, {args.profile} server)")
+    print("=" * 50)
+    print(f"import app:          median {statistics.median(imports):.2f}s  (min {min(imports):.2f}s)")
+    print(f"first 200 from /:    median {statistics.median(responses):.2f}s  (min {min(responses):.2f}s)")
+    print(f"heavy modules loaded at import: {heavy}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Local XYZ tile stand-in: deterministic JPEG tiles at /{z}/{x}/{y}, with configurable latency and errors"""
+
+import argparse
+import hashlib
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+
+def render_tile(z, x, y, size=256):
+    """Deterministic tile image per (z, x, y); plain noise bytes when Pillow isn't installed."""
+    seed = hashlib.sha256(f"{z}/{x}/{y}".encode()).digest()
+    try:
+        from PIL import Image, ImageDraw
+    except ImportError:
+        return seed * (size * 8 // len(seed))
+    img = Image.new("RGB", (size, size), tuple(seed[:3]))
+    draw = ImageDraw.Draw(img)
+    for i in range(3, 27, 4):
+        x0, y0 = seed[i] % size, seed[i + 1] % size
+        draw.rectangle([x0, y0, x0 + seed[i + 2] % 96, y0 + seed[i + 3] % 96], fill=tuple(seed[i:i + 3]))
+    buf = BytesIO()
+    img.save(buf, format="JPEG", quality=85)
+    return buf.getvalue()
+
+
+class TileServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.05, jitter=0.02, error_rate=0.0):
+        super().__init__(address, TileHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.stats = {"requests": 0, "connections": 0, "errors": 0}
+        self._tiles = {}
+        self._lock = threading.Lock()
+
+    def tile(self, z, x, y):
+        key = (z, x, y)
+        with self._lock:
+            data = self._tiles.get(key)
+        if data is None:
+            data = render_tile(z, x, y)
+            with self._lock:
+                self._tiles[key] = data
+        return data
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/{{z}}/{{x}}/{{y}}"
+
+
+class TileHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like a real tile CDN
+
+    def setup(self):
+        super().setup()
+        with self.server._lock:
+            self.server.stats["connections"] += 1
+
+    def do_GET(self):
+        server = self.server
+        with server._lock:
+            server.stats["requests"] += 1
+        time.sleep(max(0.0, random.gauss(server.latency, server.jitter)))
+        try:
+            z, x, y = (int(p) for p in self.path.strip("/").split("/")[:3])
+        except ValueError:
+            self.send_error(404)
+            return
+        if random.random() < server.error_rate:
+            with server._lock:
+                server.stats["errors"] += 1
+            self.send_error(503)
+            return
+        data = server.tile(z, x, y)
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=0, latency=0.05, jitter=0.02, error_rate=0.0):
+    """Start a stand-in server on a background thread; its XYZ template is ``server.url``."""
+    server = TileServer(("127.0.0.1", port), latency, jitter, error_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05, help="mean response delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    args = parser.parse_args()
+    server = TileServer(("127.0.0.1", args.port), args.latency, args.jitter, args.error_rate)
+    print(f"Serving tiles at {server.url} (set TILE_URL to this)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Binary desktop snapshots for /get_screenshot and screenshot_tool's /screenshot
+Raw BGRA grabs are encoded straight to WebP, JPEG or PNG and sent as the
+response body; the ETag is a hash of the raw pixels, so a client holding the
+current image gets 304 without anything being encoded
+"""
+
+import hashlib
+import threading
+from io import BytesIO
+
+from PIL import Image
+
+# name -> (Pillow format, MIME type, default level, level range)
+# level is the quality for WebP/JPEG and zlib compress_level for PNG
+FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg", 85, (1, 95)),
+    "webp": ("WEBP", "image/webp", 80, (1, 100)),
+    "png": ("PNG", "image/png", 1, (0, 9)),
+}
+DEFAULT_FORMAT = "jpeg"
+
+_last = {"etag": None, "body": None}
+_last_lock = threading.Lock()
+
+
+def parse_options(args):
+    """(format, level) from request args (?format=&level=), or raises ValueError with a client-facing message."""
+    fmt = (args.get("format") or DEFAULT_FORMAT).lower()
+    if fmt == "jpg":
+        fmt = "jpeg"
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    _, _, default, (low, high) = FORMATS[fmt]
+    level = args.get("level")
+    try:
+        level = default if level in (None, "") else int(level)
+    except ValueError:
+        raise ValueError("level must be an integer") from None
+    if not low <= level <= high:
+        raise ValueError(f"level for {fmt} must be between {low} and {high}")
+    return fmt, level
+
+
+def encode(img, fmt, level):
+    pil_format = FORMATS[fmt][0]
+    buf = BytesIO()
+    if fmt == "png":
+        img.save(buf, format=pil_format, compress_level=level)
+    elif fmt == "webp":
+        img.save(buf, format=pil_format, quality=level, method=0)  # method 0: fastest encoder setting
+    else:
+        img.save(buf, format=pil_format, quality=level)
+    return buf.getvalue()
+
+
+def render(bgra, size, fmt, level, if_none_match=None):
+    """(status, body, headers) for a raw BGRA frame of ``size``.
+
+    The last encoded snapshot is kept, so repeated requests for an unchanged
+    screen from clients without the ETag don't encode it again either.
+    """
+    digest = hashlib.blake2b(bgra, digest_size=16).hexdigest()
+    etag = f'"{digest}-{fmt}{level}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "no-cache",
+        "X-Image-Width": str(size[0]),
+        "X-Image-Height": str(size[1]),
+        "Access-Control-Expose-Headers": "ETag, X-Image-Width, X-Image-Height, X-Frame-Source, X-Capture-Source",
+    }
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return 304, b"", headers
+    with _last_lock:
+        body = _last["body"] if _last["etag"] == etag else None
+    if body is None:
+        img = Image.frombuffer("RGB", size, bgra, "raw", "BGRX", 0, 1)
+        body = encode(img, fmt, level)
+        with _last_lock:
+            _last.update(etag=etag, body=body)
+    headers["Content-Type"] = FORMATS[fmt][1]
+    return 200, body, headers
@@ -21,8 +21,8 @@ source .venv/bin/activate
 python screenshot_tool.py &
 SCREENSHOT_PID=$!
 
-# Start main app (foreground so user can see logs)
-python -u -O app.py
+# Start main app (foreground so user can see logs); it shares its frames with the screenshot tool
+SHARED_CAPTURE=1 python -u -O app.py
 
 # Kill screenshot tool if main app exits
 kill $SCREENSHOT_PID 2>/dev/null
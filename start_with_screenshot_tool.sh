@@ -10,7 +10,7 @@ sleep 2
 
 # Start the main Gradio app
 echo "🚀 Starting Main Application..."
-python app.py
+SHARED_CAPTURE=1 python app.py
 
 # Clean up Flask process when app exits
 kill $FLASK_PID 2>/dev/null || true
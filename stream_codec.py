@@ -0,0 +1,288 @@
+"""
+Inter-frame encoded desktop stream (H.264 in fragmented MP4)
+Frames from the capture thread are piped into one ffmpeg process and the
+resulting fragments are fanned out to every /video_stream_h264 viewer
+"""
+
+import os
+import queue
+import re
+import shutil
+import struct
+import subprocess
+import threading
+
+DEFAULT_BITRATE = os.environ.get("STREAM_BITRATE", "2M")
+DEFAULT_KEYINT = int(os.environ.get("STREAM_KEYINT", 60))
+# Bits per second as ffmpeg's -b:v takes it: 2000000, 2500k, 2M
+BITRATE_PATTERN = re.compile(r"\d+(\.\d+)?[kKmM]?")
+MAX_KEYINT = 600
+
+
+def parse_bitrate(value):
+    """A request's bitrate, checked before it goes into the ffmpeg command line; ValueError if invalid."""
+    value = str(value).strip()
+    if not BITRATE_PATTERN.fullmatch(value) or float(value.rstrip("kKmM")) <= 0:
+        raise ValueError(f"Bitrate must look like 2M, 2500k or 2000000, got {value!r}")
+    return value
+
+
+def parse_keyint(value):
+    """A request's keyframe interval in frames; ValueError if it isn't an integer from 1 to MAX_KEYINT."""
+    try:
+        keyint = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Keyframe interval must be a whole number of frames, got {value!r}") from None
+    if not 1 <= keyint <= MAX_KEYINT:
+        raise ValueError(f"Keyframe interval must be between 1 and {MAX_KEYINT} frames")
+    return keyint
+
+
+def ffmpeg_available():
+    return shutil.which("ffmpeg") is not None
+
+
+def iter_boxes(data):
+    """Yield (type, payload) for each ISO BMFF box in data."""
+    offset = 0
+    while offset + 8 <= len(data):
+        size, box_type = struct.unpack(">I4s", data[offset:offset + 8])
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", data[offset + 8:offset + 16])[0]
+            header = 16
+        elif size == 0:
+            size = len(data) - offset
+        yield box_type, data[offset + header:offset + size]
+        offset += size
+
+
+def first_sample_is_sync(moof):
+    """True when the first sample of a moof fragment is a keyframe."""
+    default_flags = None
+    for box_type, traf in iter_boxes(moof):
+        if box_type != b"traf":
+            continue
+        for child_type, child in iter_boxes(traf):
+            flags = int.from_bytes(child[1:4], "big")
+            if child_type == b"tfhd":
+                # track_ID, then optional fields in flag order
+                pos = 8
+                pos += 8 if flags & 0x01 else 0
+                pos += 4 if flags & 0x02 else 0
+                pos += 4 if flags & 0x08 else 0
+                pos += 4 if flags & 0x10 else 0
+                if flags & 0x20:
+                    default_flags = struct.unpack(">I", child[pos:pos + 4])[0]
+            elif child_type == b"trun":
+                pos = 8  # version/flags + sample_count
+                pos += 4 if flags & 0x01 else 0
+                if flags & 0x04:
+                    sample_flags = struct.unpack(">I", child[pos:pos + 4])[0]
+                elif flags & 0x400:
+                    pos += 4 if flags & 0x100 else 0
+                    pos += 4 if flags & 0x200 else 0
+                    sample_flags = struct.unpack(">I", child[pos:pos + 4])[0]
+                else:
+                    sample_flags = default_flags
+                if sample_flags is None:
+                    return False
+                # sample_is_non_sync_sample bit
+                return not (sample_flags >> 16) & 0x1
+    return False
+
+
+def avc_codec_string(init_segment):
+    # avcC starts with configurationVersion, profile, profile compatibility, level
+    pos = init_segment.find(b"avcC")
+    if pos < 0:
+        return "avc1.42E01F"
+    profile, compat, level = init_segment[pos + 5:pos + 8]
+    return f"avc1.{profile:02X}{compat:02X}{level:02X}"
+
+
+class _Subscriber:
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.waiting_for_key = True
+
+
+class FragmentedStreamEncoder:
+    """One ffmpeg libx264 process producing fragmented MP4 for all viewers.
+
+    Every frame becomes its own fragment so latency stays at one frame.
+    Viewers start at a keyframe; a viewer whose queue overflows skips ahead to
+    the next keyframe instead of buffering without bound.
+    """
+
+    def __init__(self, size, fps=30, bitrate=DEFAULT_BITRATE, keyint=DEFAULT_KEYINT, viewer_queue=90):
+        self.size = size
+        self.fps = fps
+        self.bitrate = bitrate
+        self.keyint = keyint
+        self.viewer_queue = viewer_queue
+        self.init_segment = None
+        self.codec = None
+        self.frames_dropped = 0
+        self._init_ready = threading.Event()
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._frames = queue.Queue(maxsize=1)
+        # Frames are copied into these before queueing: a Frame is a view into the capture's
+        # ring, which reuses the slot a few frames later, possibly mid-write to ffmpeg.
+        # Two buffers: one queued, one being written; with neither free the frame is dropped
+        self._free = queue.Queue()
+        for _ in range(2):
+            self._free.put(bytearray(size[0] * size[1] * 4))
+        self._proc = None
+        self._closed = False
+
+    def command(self):
+        w, h = self.size
+        return [
+            "ffmpeg", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgra", "-s", f"{w}x{h}",
+            "-framerate", str(self.fps), "-use_wallclock_as_timestamps", "1",
+            "-i", "pipe:0",
+            "-an", "-vf", "scale=trunc(iw/2)*2:trunc(ih/2)*2", "-pix_fmt", "yuv420p",
+            "-c:v", "libx264", "-preset", "ultrafast", "-tune", "zerolatency",
+            "-b:v", str(self.bitrate), "-maxrate", str(self.bitrate), "-bufsize", str(self.bitrate),
+            "-g", str(self.keyint), "-keyint_min", str(self.keyint), "-sc_threshold", "0", "-bf", "0",
+            "-f", "mp4", "-movflags", "empty_moov+default_base_moof+frag_every_frame",
+            "-flush_packets", "1", "pipe:1",
+        ]
+
+    def start(self):
+        self._proc = subprocess.Popen(self.command(), stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        threading.Thread(target=self._feed_loop, daemon=True).start()
+        threading.Thread(target=self._read_loop, daemon=True).start()
+        print(f"[INFO] H.264 encoder started: {self.size[0]}x{self.size[1]} @ {self.fps} fps, "
+              f"{self.bitrate}bps, keyint {self.keyint}")
+        return self
+
+    def write(self, frame):
+        """Queue a captured Frame; never blocks the capture thread."""
+        if self._closed:
+            return
+        try:
+            buf = self._free.get_nowait()
+        except queue.Empty:
+            self.frames_dropped += 1
+            return
+        buf[:] = memoryview(frame.bgra).cast("B")
+        try:
+            self._frames.put_nowait(buf)
+        except queue.Full:
+            self._free.put(buf)
+            self.frames_dropped += 1
+
+    def _feed_loop(self):
+        while not self._closed:
+            try:
+                bgra = self._frames.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self._proc.stdin.write(bgra)
+            except (BrokenPipeError, ValueError, OSError):
+                break
+            finally:
+                self._free.put(bgra)
+
+    def _read_exact(self, n):
+        data = self._proc.stdout.read(n)
+        return data if data and len(data) == n else None
+
+    def _read_loop(self):
+        init = b""
+        moof = None
+        while True:
+            header = self._read_exact(8)
+            if header is None:
+                break
+            size, box_type = struct.unpack(">I4s", header)
+            if size == 1:
+                large = self._read_exact(8)
+                if large is None:
+                    break
+                header += large
+                size = struct.unpack(">Q", large)[0]
+            payload = self._read_exact(size - len(header))
+            if payload is None:
+                break
+            box = header + payload
+            if box_type in (b"ftyp", b"moov"):
+                init += box
+                if box_type == b"moov":
+                    self.init_segment = init
+                    self.codec = avc_codec_string(init)
+                    self._init_ready.set()
+            elif box_type == b"moof":
+                moof = box
+            elif box_type == b"mdat" and moof is not None:
+                self._publish(moof + box, first_sample_is_sync(moof[8:]))
+                moof = None
+        self.close()
+
+    def _publish(self, fragment, is_key):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            if sub.waiting_for_key and not is_key:
+                continue
+            try:
+                sub.queue.put_nowait(fragment)
+                sub.waiting_for_key = False
+            except queue.Full:
+                # Too slow to keep up: resume at the next keyframe
+                sub.waiting_for_key = True
+
+    def wait_ready(self, timeout=5.0):
+        return self._init_ready.wait(timeout)
+
+    def subscribe(self):
+        sub = _Subscriber(self.viewer_queue)
+        with self._lock:
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def stream(self):
+        """Generator for one viewer: init segment, then fragments from the next keyframe."""
+        sub = self.subscribe()
+        try:
+            yield self.init_segment
+            while not self._closed:
+                try:
+                    fragment = sub.queue.get(timeout=1.0)
+                except queue.Empty:
+                    continue
+                if fragment is None:
+                    break
+                yield fragment
+        finally:
+            self.unsubscribe(sub)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            try:
+                sub.queue.put_nowait(None)
+            except queue.Full:
+                pass
+        if self._proc:
+            try:
+                self._proc.stdin.close()
+            except OSError:
+                pass
+            try:
+                self._proc.wait(timeout=2.0)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
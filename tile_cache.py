@@ -0,0 +1,281 @@
+"""
+Persistent satellite tile cache
+Tiles are keyed by (z, x, y) and stored content-addressed on disk with a
+SQLite index, so they survive restarts and are shared by every process on the
+host; a small in-memory LRU sits in front as the hot tier
+"""
+
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+
+TILE_CACHE_DIR = os.environ.get(
+    "TILE_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "drone-localization", "tiles"))
+TILE_CACHE_BYTES = int(os.environ.get("TILE_CACHE_MB", 512)) * 1024 * 1024
+TILE_CACHE_POLICY = os.environ.get("TILE_CACHE_POLICY", "lru")
+TILE_MEMORY_TILES = int(os.environ.get("TILE_MEMORY_TILES", 500))
+# XYZ template, e.g. https://server/tile/{z}/{y}/{x}
+TILE_URL = os.environ.get("TILE_URL", "")
+TILE_TIMEOUT = 3.0
+
+POLICIES = ("lru", "lfu")
+
+
+def latlon_to_tile(lat, lon, zoom):
+    """Web Mercator (slippy map) tile containing lat/lon."""
+    n = 2 ** zoom
+    lat_rad = math.radians(max(min(lat, 85.05112878), -85.05112878))
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_to_latlon(x, y, zoom):
+    """Centre of tile (x, y) as (lat, lon)."""
+    n = 2 ** zoom
+    lon = (x + 0.5) / n * 360.0 - 180.0
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 0.5) / n))))
+    return lat, lon
+
+
+def tile_image(data):
+    from PIL import Image
+
+    return Image.open(BytesIO(data)).convert("RGB")
+
+
+def http_fetch(z, x, y, url=None, timeout=TILE_TIMEOUT):
+    """Plain single-request download from the TILE_URL template."""
+    import requests
+
+    template = url or TILE_URL
+    if not template:
+        raise RuntimeError("TILE_URL is not set (expected an XYZ template like https://server/{z}/{y}/{x})")
+    resp = requests.get(template.format(z=z, x=x, y=y), timeout=timeout)
+    resp.raise_for_status()
+    return resp.content
+
+
+class TileStore:
+    """On-disk tile store shared between processes.
+
+    Tile bytes live under ``objects/`` named by their SHA-256, so identical
+    tiles (sea, desert) are stored once; ``index.sqlite`` maps (z, x, y) to a
+    digest with size, last access time and hit count. SQLite's locking makes
+    the index safe for concurrent processes; writes and eviction run inside
+    one immediate transaction, so a blob is never deleted while another
+    process is inserting a reference to it.
+
+    When the stored bytes exceed ``max_bytes`` tiles are evicted down to 90%
+    of the budget, least recently used first (``policy="lru"``) or least
+    frequently used first (``policy="lfu"``).
+    """
+
+    def __init__(self, root=TILE_CACHE_DIR, max_bytes=TILE_CACHE_BYTES, policy=TILE_CACHE_POLICY):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown tile cache policy {policy!r}, expected one of {POLICIES}")
+        self.root = root
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self._local = threading.local()
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        with self._db() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS tiles (
+                z INTEGER, x INTEGER, y INTEGER, digest TEXT NOT NULL, size INTEGER NOT NULL,
+                atime REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (z, x, y))""")
+            db.execute("CREATE INDEX IF NOT EXISTS tiles_digest ON tiles (digest)")
+
+    def _db(self):
+        # One connection per thread; sqlite3 connections can't be shared across threads
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(os.path.join(self.root, "index.sqlite"), timeout=30.0, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return _Transaction(db)
+
+    def _blob_path(self, digest):
+        return os.path.join(self.root, "objects", digest[:2], digest)
+
+    def get(self, z, x, y):
+        with self._db() as db:
+            row = db.execute("SELECT digest FROM tiles WHERE z=? AND x=? AND y=?", (z, x, y)).fetchone()
+            if row is None:
+                return None
+            try:
+                with open(self._blob_path(row[0]), "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                # Blob removed behind our back (manual cleanup); forget the entry
+                db.execute("DELETE FROM tiles WHERE z=? AND x=? AND y=?", (z, x, y))
+                return None
+            db.execute("UPDATE tiles SET atime=?, hits=hits+1 WHERE z=? AND x=? AND y=?", (time.time(), z, x, y))
+        return data
+
+    def put(self, z, x, y, data):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        with self._db() as db:
+            db.execute("BEGIN IMMEDIATE")
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            old = db.execute("SELECT digest FROM tiles WHERE z=? AND x=? AND y=?", (z, x, y)).fetchone()
+            db.execute("INSERT OR REPLACE INTO tiles (z, x, y, digest, size, atime, hits) VALUES (?, ?, ?, ?, ?, ?, 0)",
+                       (z, x, y, digest, len(data), time.time()))
+            if old and old[0] != digest:
+                self._drop_unreferenced(db, [old[0]])
+            self._evict(db)
+        return digest
+
+    def _stored_bytes(self, db):
+        return db.execute("SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM tiles)").fetchone()[0]
+
+    def _drop_unreferenced(self, db, digests):
+        for digest in digests:
+            if db.execute("SELECT 1 FROM tiles WHERE digest=? LIMIT 1", (digest,)).fetchone() is None:
+                try:
+                    os.remove(self._blob_path(digest))
+                except FileNotFoundError:
+                    pass
+
+    def _evict(self, db):
+        total = self._stored_bytes(db)
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        order = "atime" if self.policy == "lru" else "hits, atime"
+        victims = db.execute(f"SELECT z, x, y, digest, size FROM tiles ORDER BY {order}").fetchall()
+        for z, x, y, digest, size in victims:
+            if total <= target:
+                break
+            db.execute("DELETE FROM tiles WHERE z=? AND x=? AND y=?", (z, x, y))
+            if db.execute("SELECT 1 FROM tiles WHERE digest=? LIMIT 1", (digest,)).fetchone() is None:
+                try:
+                    os.remove(self._blob_path(digest))
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def stats(self):
+        with self._db() as db:
+            tiles, = db.execute("SELECT COUNT(*) FROM tiles").fetchone()
+            stored = self._stored_bytes(db)
+        return {"tiles": tiles, "bytes": stored, "max_bytes": self.max_bytes, "policy": self.policy}
+
+
+class _Transaction:
+    """Context manager that commits an open transaction on success and rolls it back on error."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.db.in_transaction:
+            self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+class TileCache:
+    """Memory LRU -> TileStore -> fetch(z, x, y), filling both tiers on a miss."""
+
+    def __init__(self, store=None, fetch=http_fetch, memory_tiles=TILE_MEMORY_TILES):
+        self.store = store if store is not None else TileStore()
+        self.fetch = fetch
+        self.memory_tiles = memory_tiles
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._prefetching = threading.Lock()
+
+    def _remember(self, key, data):
+        with self._lock:
+            self._memory[key] = data
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_tiles:
+                self._memory.popitem(last=False)
+
+    def _cached(self, key):
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return data
+        data = self.store.get(*key)
+        if data is not None:
+            self.stats["disk_hits"] += 1
+            self._remember(key, data)
+        return data
+
+    def _add(self, key, data):
+        self.store.put(*key, data)
+        self._remember(key, data)
+
+    def get(self, z, x, y):
+        """Encoded tile bytes for (z, x, y)."""
+        key = (z, x, y)
+        data = self._cached(key)
+        if data is None:
+            self.stats["misses"] += 1
+            data = self.fetch(z, x, y)
+            self._add(key, data)
+        return data
+
+    def get_many(self, tiles):
+        """{(z, x, y): bytes} of the tiles that could be served; failed downloads are logged and left out.
+
+        Misses download concurrently when fetch has fetch_many (tile_fetcher.TileFetcher).
+        """
+        results, missing = {}, []
+        for tile in tiles:
+            key = tuple(tile)
+            data = self._cached(key)
+            if data is None:
+                missing.append(key)
+            else:
+                results[key] = data
+        if missing:
+            self.stats["misses"] += len(missing)
+            if hasattr(self.fetch, "fetch_many"):
+                fetched = self.fetch.fetch_many(missing)
+            else:
+                fetched = {}
+                for key in missing:
+                    try:
+                        fetched[key] = self.fetch(*key)
+                    except Exception as e:
+                        print(f"[WARN] Tile {key} failed: {e}")
+            for key, data in fetched.items():
+                self._add(key, data)
+                results[key] = data
+        return results
+
+    def prefetch(self, tiles):
+        """Warm both tiers with ``tiles`` in the background; skipped while an earlier prefetch still runs."""
+        if not self._prefetching.acquire(blocking=False):
+            return False
+
+        def run():
+            try:
+                self.get_many(tiles)
+            except Exception as e:
+                print(f"[WARN] Tile prefetch failed: {e}")
+            finally:
+                self._prefetching.release()
+        threading.Thread(target=run, daemon=True).start()
+        return True
+
+    def get_image(self, z, x, y):
+        return tile_image(self.get(z, x, y))
@@ -0,0 +1,113 @@
+"""
+Concurrent satellite tile fetcher
+One keep-alive session pool shared by a bounded set of worker threads;
+duplicate requests for a tile that is already in flight wait on the same
+download, and failed downloads are retried with jittered exponential backoff
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from tile_cache import TILE_TIMEOUT, TILE_URL
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def neighbour_ring(tiles, width=1):
+    """Tiles in a band of ``width`` around the bounding box of ``tiles`` (same zoom), for prefetching."""
+    if not tiles:
+        return []
+    z = tiles[0][0]
+    xs = [t[1] for t in tiles]
+    ys = [t[2] for t in tiles]
+    x0, x1, y0, y1 = min(xs) - width, max(xs) + width, min(ys) - width, max(ys) + width
+    inner = set(tiles)
+    n = 2 ** z
+    return [(z, x, y) for y in range(y0, y1 + 1) for x in range(x0, x1 + 1)
+            if 0 <= x < n and 0 <= y < n and (z, x, y) not in inner]
+
+
+class TileFetcher:
+    """Callable ``fetch(z, x, y) -> bytes`` for TileCache, safe to call from many threads.
+
+    At most ``max_concurrency`` downloads run at once, all over one
+    requests.Session whose connection pool holds as many keep-alive
+    connections. 4xx responses (other than 429) fail immediately; timeouts,
+    connection errors, 429 and 5xx are retried up to ``retries`` times,
+    sleeping a random 0..backoff * 2**attempt seconds in between so workers
+    that failed together don't retry in lockstep.
+    """
+
+    def __init__(self, url=None, max_concurrency=8, timeout=TILE_TIMEOUT, retries=3, backoff=0.25):
+        self.url = url or TILE_URL
+        if not self.url:
+            raise RuntimeError("TILE_URL is not set (expected an XYZ template like https://server/{z}/{y}/{x})")
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.stats = {"requests": 0, "coalesced": 0, "retries": 0, "failures": 0}
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency, pool_block=True, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="tile-fetch")
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, z, x, y):
+        return self.submit(z, x, y).result()
+
+    def submit(self, z, x, y):
+        """Future for tile (z, x, y); joins the existing download if one is in flight."""
+        key = (z, x, y)
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.stats["coalesced"] += 1
+                return future
+            future = self._executor.submit(self._download, z, x, y)
+            self._inflight[key] = future
+        future.add_done_callback(lambda _: self._forget(key))
+        return future
+
+    def _forget(self, key):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def fetch_many(self, tiles):
+        """{(z, x, y): bytes} for every tile that downloaded; failures are logged and left out."""
+        futures = {tuple(t): self.submit(*t) for t in tiles}
+        results = {}
+        for key, future in futures.items():
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                print(f"[WARN] Tile {key} failed: {e}")
+        return results
+
+    def _download(self, z, x, y):
+        url = self.url.format(z=z, x=x, y=y)
+        for attempt in range(self.retries + 1):
+            self.stats["requests"] += 1
+            try:
+                resp = self.session.get(url, timeout=self.timeout)
+                if resp.status_code not in RETRY_STATUS:
+                    resp.raise_for_status()
+                    return resp.content
+                error = requests.HTTPError(f"{resp.status_code} for {url}", response=resp)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            if attempt < self.retries:
+                self.stats["retries"] += 1
+                time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+        self.stats["failures"] += 1
+        raise error
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
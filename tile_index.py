@@ -0,0 +1,190 @@
+"""
+Satellite tile embedding index
+ResNet50 embeddings of a region's tiles are computed once and stored as an
+L2-normalized matrix (.npy, memory-mapped on load) with a (z, x, y)
+coordinate sidecar; a query is one matrix-vector product, or for large
+regions an IVF probe of the nearest clusters
+"""
+
+import json
+import math
+import os
+
+import numpy as np
+
+from tile_cache import latlon_to_tile
+
+TILE_INDEX_DIR = os.environ.get(
+    "TILE_INDEX_DIR", os.path.join(os.path.expanduser("~"), ".cache", "drone-localization", "index"))
+INDEX_DTYPE = os.environ.get("TILE_INDEX_DTYPE", "float16")
+# Regions with at least this many tiles get an IVF index instead of exhaustive search
+IVF_MIN_TILES = int(os.environ.get("TILE_INDEX_IVF_MIN", 20000))
+DEFAULT_NPROBE = 8
+# Rows scored per matmul in exhaustive search, so a memory-mapped float16 matrix is upcast piecewise
+CHUNK_ROWS = 65536
+
+
+def region_tiles(lat, lon, grid=5, zoom=18):
+    """(z, x, y) of the grid x grid tiles centred on lat/lon, row by row."""
+    cx, cy = latlon_to_tile(lat, lon, zoom)
+    half = grid // 2
+    return [(zoom, cx + dx, cy + dy) for dy in range(-half, grid - half) for dx in range(-half, grid - half)]
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def embed_images(model, images, device, batch_size=32, order="RGB"):
+    """PIL images or HWC uint8 arrays -> (N, 2048) float32 embeddings."""
+    import torch
+    from inference import preprocess_frames
+
+    out = []
+    for i in range(0, len(images), batch_size):
+        batch = preprocess_frames([np.asarray(img) for img in images[i:i + batch_size]], order=order).to(device)
+        with torch.inference_mode():
+            out.append(model(batch).flatten(1).float().cpu().numpy())
+    return np.concatenate(out) if out else np.empty((0, 2048), dtype=np.float32)
+
+
+def spherical_kmeans(x, k, iters=10, seed=0):
+    """Centroids (k, D) of unit vectors x, clustering by cosine similarity."""
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), k, replace=False)].astype(np.float32)
+    for _ in range(iters):
+        assign = nearest_centroid(x, centroids)
+        counts = np.bincount(assign, minlength=k)
+        empty = counts == 0
+        # Per-cluster sums as one reduceat over the rows sorted by cluster
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        sums = np.zeros_like(centroids)
+        sums[~empty] = np.add.reduceat(x[np.argsort(assign, kind="stable")], starts[~empty], axis=0)
+        # Reseed empty clusters from random points rather than leaving them dead
+        sums[empty] = x[rng.choice(len(x), int(empty.sum()), replace=False)]
+        centroids = normalize(sums)
+    return centroids
+
+
+def nearest_centroid(x, centroids):
+    return np.concatenate([
+        np.argmax(np.asarray(x[i:i + CHUNK_ROWS], dtype=np.float32) @ centroids.T, axis=1)
+        for i in range(0, len(x), CHUNK_ROWS)
+    ])
+
+
+def _top_k(scores, k):
+    k = min(k, scores.shape[-1])
+    part = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=-1), axis=-1)
+    return np.take_along_axis(part, order, axis=-1)
+
+
+class EmbeddingIndex:
+    """Cosine nearest-neighbour search over tile embeddings.
+
+    ``embeddings`` is (N, D) L2-normalized (float16 by default, half the
+    memory and disk of float32 with no visible ranking change) and
+    ``coords`` the matching (N, 3) int32 z, x, y. With an IVF index the rows
+    are grouped by cluster, ``offsets[c]:offsets[c + 1]`` being cluster c,
+    and a query only scores the ``nprobe`` clusters closest to it.
+    """
+
+    FILES = ("embeddings.npy", "coords.npy", "centroids.npy", "offsets.npy")
+
+    def __init__(self, embeddings, coords, centroids=None, offsets=None, meta=None):
+        self.embeddings = embeddings
+        self.coords = coords
+        self.centroids = centroids
+        self.offsets = offsets
+        self.meta = meta or {}
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    @classmethod
+    def build(cls, embeddings, coords, dtype=INDEX_DTYPE, ivf=None, model=None):
+        embeddings = normalize(embeddings)
+        coords = np.asarray(coords, dtype=np.int32).reshape(-1, 3)
+        if ivf is None:
+            ivf = len(embeddings) >= IVF_MIN_TILES
+        centroids = offsets = None
+        if ivf:
+            nlist = max(1, int(math.sqrt(len(embeddings))))
+            rng = np.random.default_rng(0)
+            sample = embeddings[rng.choice(len(embeddings), min(len(embeddings), 32 * nlist), replace=False)]
+            centroids = spherical_kmeans(sample, nlist)
+            assign = nearest_centroid(embeddings, centroids)
+            order = np.argsort(assign, kind="stable")
+            embeddings, coords = embeddings[order], coords[order]
+            offsets = np.searchsorted(assign[order], np.arange(nlist + 1)).astype(np.int64)
+        meta = {"count": len(embeddings), "dim": int(embeddings.shape[1]) if embeddings.ndim == 2 else 0,
+                "dtype": dtype, "ivf": bool(ivf), "model": model}
+        return cls(embeddings.astype(dtype), coords, centroids, offsets, meta)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        arrays = dict(zip(self.FILES, (self.embeddings, self.coords, self.centroids, self.offsets)))
+        for name, array in arrays.items():
+            target = os.path.join(path, name)
+            if array is None:
+                if os.path.exists(target):
+                    os.remove(target)
+                continue
+            tmp = f"{target}.{os.getpid()}.tmp.npy"
+            np.save(tmp, np.ascontiguousarray(array))
+            os.replace(tmp, target)
+        # meta.json goes last: an index directory is complete once it exists
+        tmp = os.path.join(path, f"meta.json.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, os.path.join(path, "meta.json"))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        mode = "r" if mmap else None
+        arrays = [np.load(os.path.join(path, name), mmap_mode=mode) if os.path.exists(os.path.join(path, name)) else None
+                  for name in cls.FILES]
+        return cls(*arrays, meta=meta)
+
+    def _score_rows(self, queries, start, stop):
+        scores = np.empty((len(queries), stop - start), dtype=np.float32)
+        for i in range(start, stop, CHUNK_ROWS):
+            end = min(i + CHUNK_ROWS, stop)
+            scores[:, i - start:end - start] = queries @ np.asarray(self.embeddings[i:end], dtype=np.float32).T
+        return scores
+
+    def search(self, query, k=5, nprobe=DEFAULT_NPROBE):
+        """Top-k cosine matches: (scores, coords) shaped (k,), (k, 3) for one query, (Q, k), (Q, k, 3) for a batch."""
+        queries = normalize(query)
+        single = queries.ndim == 1
+        if single:
+            queries = queries[None]
+        if self.centroids is None:
+            scores = self._score_rows(queries, 0, len(self))
+            idx = _top_k(scores, k)
+            top_scores = np.take_along_axis(scores, idx, axis=-1)
+        else:
+            top_scores, idx = self._search_ivf(queries, k, nprobe)
+        coords = np.asarray(self.coords)[idx]
+        if single:
+            return top_scores[0], coords[0]
+        return top_scores, coords
+
+    def _search_ivf(self, queries, k, nprobe):
+        probes = _top_k(queries @ self.centroids.T, nprobe)
+        all_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        all_idx = np.zeros((len(queries), k), dtype=np.int64)
+        for q, clusters in enumerate(probes):
+            rows = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in clusters])
+            if not len(rows):
+                continue
+            scores = np.asarray(self.embeddings[rows], dtype=np.float32) @ queries[q]
+            best = _top_k(scores, k)
+            all_scores[q, :len(best)] = scores[best]
+            all_idx[q, :len(best)] = rows[best]
+        return all_scores, all_idx